@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import socket
+
+"""
+Thin client of daemon.py
+
+Usage:
+    python3 client.py graph [main.py arguments]
+    python3 client.py solve [groebner_solver.py arguments]
+    python3 client.py shutdown
+
+The address of the daemon is read from the TENSOR_GRAPH_DAEMON environment
+variable: a Unix socket path or host:port (default /tmp/tensor_graph.sock).
+For host:port, the access token is read from the file written by the daemon
+(TENSOR_GRAPH_TOKEN, default ~/.cache/tensor_graph/daemon.token).
+"""
+
+DEFAULT_SOCKET = "/tmp/tensor_graph.sock"
+DEFAULT_TOKEN_FILE = os.environ.get("TENSOR_GRAPH_TOKEN",
+                                    os.path.expanduser("~/.cache/tensor_graph/daemon.token"))
+
+
+def connect(address):
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        return socket.create_connection((host, int(port)))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+
+#Sends a job and prints its output as it is streamed back
+def run(command, argv, address=DEFAULT_SOCKET, token_file=DEFAULT_TOKEN_FILE):
+    request = {"command": command, "argv": argv}
+    if ":" in address:
+        with open(token_file, "r") as f:
+            request["token"] = f.read().strip()
+    with connect(address) as sock:
+        sock.sendall((json.dumps(request) + "\n").encode())
+        for line in sock.makefile("r"):
+            msg = json.loads(line)
+            if "out" in msg:
+                print(msg["out"], flush=True)
+            elif "error" in msg:
+                sys.stderr.write(msg["error"] + "\n")
+                return 1
+            else:
+                return 0
+    sys.stderr.write("Connection closed by the daemon\n")
+    return 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.stderr.write("Usage: python3 client.py graph|solve|shutdown [arguments]\n")
+        sys.exit(1)
+    address = os.environ.get("TENSOR_GRAPH_DAEMON", DEFAULT_SOCKET)
+    sys.exit(run(sys.argv[1], sys.argv[2:], address))
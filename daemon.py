@@ -0,0 +1,317 @@
+import os
+import io
+import sys
+import hmac
+import json
+import time
+import secrets
+import asyncio
+import argparse
+import traceback
+import multiprocessing
+from collections import OrderedDict
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+"""
+Long-running analysis daemon
+
+Keeps a pool of worker processes with SageMath, the graph code and the
+Groebner solver already imported, so jobs skip the interpreter and Sage
+startup paid by every `sage main.py ...` invocation. Built graphs are kept
+in a per-worker LRU cache.
+
+Protocol: the client sends one JSON line {"command": ..., "argv": [...]}
+where argv are the usual arguments of main.py ("graph") or of
+square_solver/groebner_solver.py ("solve"). The daemon answers with JSON
+lines {"out": line} streamed while the job runs, followed by either
+{"done": seconds} or {"error": message}.
+
+Jobs can run arbitrary code (tensor files are read with sage_eval), so only
+the owner of the daemon may connect: the Unix socket is created with mode
+0600, and in TCP mode every request must carry the random token that the
+daemon writes to an owner-only file ({"token": ..., "command": ...}).
+"""
+
+DEFAULT_SOCKET = "/tmp/tensor_graph.sock"
+DEFAULT_TOKEN_FILE = os.environ.get("TENSOR_GRAPH_TOKEN",
+                                    os.path.expanduser("~/.cache/tensor_graph/daemon.token"))
+
+#Number of built graphs kept by every worker
+GRAPH_CACHE = 16
+
+
+#---------------------------
+# Worker side
+#---------------------------
+_graphs = OrderedDict()
+
+
+#Imports Sage and the analysis modules once per worker
+def init_worker():
+    global main, tools, groebner_solver
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    sys.path.insert(0, os.path.join(here, "square_solver"))
+    import main
+    import tools
+    import groebner_solver
+
+
+#File-like object forwarding every printed line to the daemon
+class QueueWriter(io.TextIOBase):
+    def __init__(self, queue):
+        self.queue = queue
+        self.buffer = ""
+
+    def write(self, s):
+        self.buffer += s
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.queue.put(line)
+        return len(s)
+
+    def flush(self):
+        if self.buffer:
+            self.queue.put(self.buffer)
+            self.buffer = ""
+
+
+#Builds the graph of T, or reuses the one built by a previous job
+def cached_graph(T, n, m, k, F, verbose, minimal, plan):
+    #every engine labels vertices alike, so the graph does not depend on the plan
+    key = (F.order(), tuple(str(x) for M in T for row in M for x in row), n, m, k)
+    if key in _graphs:
+        _graphs.move_to_end(key)
+        if not(minimal):
+            print("Reusing cached graph")
+    else:
+        start = time.time()
+        _graphs[key] = main.tensor_to_graph(T, n, m, k, F, verbose, minimal,
+                                             plan["engine"], plan["block"], plan["chunk"])
+        if not(minimal):
+            print(f"Computation time: {time.time() - start}")
+        if len(_graphs) > GRAPH_CACHE:
+            _graphs.popitem(last=False)
+    return _graphs[key].copy()
+
+
+#Same pipeline as main.py without the matplotlib window
+def graph_job(argv):
+    args = main.argparser(argv)
+    n, m, k, q = args.n, args.m, args.k, args.q
+    F = main.GF(q, 'a')
+    if args.load_tensor == "":
+        T = [[[F.random_element() for _ in range(k)] for _ in range(m)] for _ in range(n)]
+    else:
+        T = main.parse_tensor_from_file(args.load_tensor, q)
+
+    if args.ego_point != "":
+        G, center = main.gen_ego_graph(T, n, m, k, F, args.ego_point, args.ego_partition, args.ego_radius,
+                                       args.ego_max_vertices, args.verbose, args.minimal)
+        print(G.edges(labels=False))
+        if args.c != None and args.c > 2:
+            tools.cycle_nodes(G, n, m, k, q, args.c, args.loose)
+        return
+
+    #out-of-core runs only print statistics, use main.py --out_of_core for them
+    plan = main.choose_engine(args, T, n, m, k, q, out_of_core=False)
+
+    tensors = [T]
+    if args.isometry:
+        A = main.random_matrix(F, n, n, algorithm='unimodular')
+        B = main.random_matrix(F, m, m, algorithm='unimodular')
+        C = main.random_matrix(F, k, k, algorithm='unimodular')
+        tensors.append(main.apply_isometry(T, A, B, C, plan["engine"]))
+
+    for T in tensors:
+        G = cached_graph(T, n, m, k, F, args.verbose, args.minimal, plan)
+        print("Tensor T:")
+        for i in range(n):
+            print(T[i])
+            print()
+        main.filter_by_degree(G, False, args.deg_lbound, args.deg_ubound, args.minimal)
+        print(f"Vertices: {G.order()}, edges: {G.size()}")
+        if args.verbose and not(args.minimal):
+            print(G.edges(labels=False))
+        if args.c != None and args.c > 2:
+            tools.cycle_nodes(G, n, m, k, q, args.c, args.loose)
+
+
+#Runs groebner_solver.py with the given arguments
+def solve_job(argv):
+    args = groebner_solver.argparser(argv)
+    n, m, k, q = args.n, args.m, args.k, args.q
+    if args.same_dim:
+        m = k = n
+    groebner_solver.verbose = not(args.minimal)
+    groebner_solver.csv = args.csv
+    if args.csv:
+        print(f"{n},{m},{k},{q},", end="")
+        groebner_solver.verbose = False
+    groebner_solver.example_all_types(q, n, m, k, charts=args.charts, workers=args.workers,
+                                      exists=args.exists, engine=args.engine)
+
+
+JOBS = {"graph": graph_job, "solve": solve_job}
+
+
+def run_job(command, argv, queue):
+    out = QueueWriter(queue)
+    try:
+        with redirect_stdout(out), redirect_stderr(out):
+            JOBS[command](argv)
+    except SystemExit as e:
+        #argparse errors and --help
+        if e.code not in (0, None):
+            out.flush()
+            return f"invalid arguments for {command}"
+    except Exception:
+        out.flush()
+        return traceback.format_exc()
+    finally:
+        out.flush()
+        queue.put(None)
+    return None
+
+
+#---------------------------
+# Server side
+#---------------------------
+async def handle_client(reader, writer, workers, manager, stop, token=None):
+    loop = asyncio.get_running_loop()
+
+    async def send(msg):
+        writer.write((json.dumps(msg) + "\n").encode())
+        await writer.drain()
+
+    try:
+        request = json.loads(await reader.readline())
+        if token is not None and not hmac.compare_digest(str(request.get("token", "")), token):
+            await send({"error": "invalid or missing token"})
+            return
+        command = request.get("command")
+        if command == "shutdown":
+            await send({"done": 0})
+            stop.set()
+            return
+        if command not in JOBS:
+            await send({"error": f"unknown command {command}, expected one of {list(JOBS)} or shutdown"})
+            return
+
+        start = time.time()
+        queue = manager.Queue()
+        pool = workers.pool
+        try:
+            job = loop.run_in_executor(pool, run_job, command, request.get("argv", []), queue)
+        except BrokenProcessPool:
+            workers.restart(pool)
+            await send({"error": "the worker pool was broken and has been restarted, retry the job"})
+            return
+        #a worker that dies (e.g. killed when out of memory) never puts the sentinel of run_job
+        job.add_done_callback(lambda _: queue.put(None))
+        while True:
+            line = await loop.run_in_executor(None, queue.get)
+            if line is None:
+                break
+            await send({"out": line})
+        try:
+            error = await job
+        except BrokenProcessPool:
+            workers.restart(pool)
+            error = "the worker running this job died (e.g. out of memory); the worker pool was restarted"
+        await send({"error": error} if error else {"done": time.time() - start})
+    except (ConnectionError, json.JSONDecodeError):
+        pass
+    finally:
+        writer.close()
+
+
+#Writes a fresh random token to a file only readable by the owner
+def write_token(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    token = secrets.token_hex(32)
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token + "\n")
+    return token
+
+
+class WorkerPool:
+    """
+    Process pool that is replaced when one of its workers dies: a broken
+    ProcessPoolExecutor refuses every later job
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+
+    def restart(self, broken):
+        #only the first handler noticing a broken pool replaces it
+        if self.pool is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+        print("A worker died, worker pool restarted", flush=True)
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def serve(socket_path, port, workers, token_file=DEFAULT_TOKEN_FILE):
+    stop = asyncio.Event()
+    with multiprocessing.Manager() as manager:
+        pool = WorkerPool(workers)
+        #start every worker now so that the first jobs do not pay for Sage
+        await asyncio.gather(*[asyncio.get_running_loop().run_in_executor(pool.pool, time.sleep, 0.1)
+                               for _ in range(workers)])
+
+        #any local user can reach a TCP port: require the token
+        token = write_token(token_file) if port else None
+
+        def handler(reader, writer):
+            return handle_client(reader, writer, pool, manager, stop, token)
+
+        if port:
+            server = await asyncio.start_server(handler, "127.0.0.1", port)
+            print(f"Listening on 127.0.0.1:{port} with {workers} workers, token in {token_file}")
+        else:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            #the socket must never exist with wider permissions than 0600
+            umask = os.umask(0o177)
+            try:
+                server = await asyncio.start_unix_server(handler, socket_path)
+            finally:
+                os.umask(umask)
+            os.chmod(socket_path, 0o600)
+            print(f"Listening on {socket_path} with {workers} workers")
+        async with server:
+            await stop.wait()
+        pool.shutdown()
+        if port:
+            if os.path.exists(token_file):
+                os.remove(token_file)
+        elif os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def argparser():
+    parser = argparse.ArgumentParser(
+        description="Keeps Sage and recently built graphs resident and runs jobs sent by client.py",
+        epilog="Example usage: sage daemon.py --workers=4"
+    )
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET, help="Unix socket to listen on")
+    parser.add_argument("--port", type=int, default=0, help="Listen on this localhost TCP port instead of a Unix socket")
+    parser.add_argument("--token_file", type=str, default=DEFAULT_TOKEN_FILE, help="File (mode 0600) where the access token of the TCP mode is written")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argparser()
+    asyncio.run(serve(args.socket, args.port, args.workers, args.token_file))
@@ -0,0 +1,233 @@
+import time
+import argparse
+import ast
+import math
+from statistics import NormalDist
+import numpy as np
+from vectorized import *
+
+"""
+Monte Carlo estimation of edge and 4-cycle statistics of tensor graphs
+
+Used for parameters (n,m,k,q) where neither tensor_to_graph nor the Groebner
+solver is feasible. Every sample draws random projective points and counts
+their completions exactly with a batched rank computation, which keeps the
+estimators unbiased and their variance far below plain rejection sampling.
+"""
+
+#Edge statistics: (X, Z) -> degree of a random x in P(X) towards P(Z)
+EDGE_TYPES = {
+    "UV": ("U", "V"),
+    "UW": ("U", "W"),
+    "VW": ("V", "W"),
+}
+
+#4-cycle types of square_solver/groebner_solver.py written as
+#(x, y, z, z') where x,y are opposite vertices and z,z' the two middle ones
+#   Type A: U -> V -> U' -> V' -> U
+#   Type B: U -> W -> U' -> W' -> U
+#   Type C: V -> W -> V' -> W' -> V
+#   Type D: U -> V -> U' -> W -> U
+#   Type E: U -> V -> W -> V' -> U
+#   Type F: U -> W -> V -> W' -> U
+CYCLE_TYPES = {
+    "A": ("U", "U", "V", "V"),
+    "B": ("U", "U", "W", "W"),
+    "C": ("V", "V", "W", "W"),
+    "D": ("U", "U", "V", "W"),
+    "E": ("U", "W", "V", "V"),
+    "F": ("U", "V", "W", "W"),
+}
+
+STATISTICS = list(EDGE_TYPES) + list(CYCLE_TYPES)
+
+
+#Draws a batch of samples of one statistic
+def sample_statistic(C, stat, rng, size, field):
+    """
+    C: tensor as an int array of shape (n, m, k)
+    stat: one of STATISTICS
+
+    returns: (values, scale, largest) such that scale * mean(values) is an
+    unbiased estimate of the number of edges / 4-cycles of the given type and
+    largest bounds every sample value
+    """
+    q = field.q
+    dims = {X: C.shape[a] for X, a in AXES.items()}
+    if stat in EDGE_TYPES:
+        X, Z = EDGE_TYPES[stat]
+        x = random_projective_points(rng, size, dims[X], q)
+        values = projective_kernel_size(neighbour_constraints(C, x, X, Z, field), field)
+        return values.astype(np.float64), projective_size(dims[X], q), projective_size(dims[Z], q)
+
+    X, Y, Z1, Z2 = CYCLE_TYPES[stat]
+    x = random_projective_points(rng, size, dims[X], q)
+    y = random_projective_points(rng, size, dims[Y], q)
+    Mx1 = neighbour_constraints(C, x, X, Z1, field)
+    My1 = neighbour_constraints(C, y, Y, Z1, field)
+    s1 = projective_kernel_size(np.concatenate([Mx1, My1], axis=1), field)
+    N1, N2 = projective_size(dims[Z1], q), projective_size(dims[Z2], q)
+    if Z1 == Z2:
+        #ordered pairs of distinct common neighbours
+        values = s1 * (s1 - 1)
+        largest = N1 * (N1 - 1)
+    else:
+        largest = N1 * N2
+        Mx2 = neighbour_constraints(C, x, X, Z2, field)
+        My2 = neighbour_constraints(C, y, Y, Z2, field)
+        values = s1 * projective_kernel_size(np.concatenate([Mx2, My2], axis=1), field)
+    if X == Y:
+        #u = u' is not a cycle
+        values[same_points(x, y, field)] = 0
+    #each cycle is met once per ordering of its opposite and middle vertices
+    symmetry = (2 if X == Y else 1) * (2 if Z1 == Z2 else 1)
+    scale = projective_size(dims[X], q) * projective_size(dims[Y], q) / symmetry
+    return values.astype(np.float64), scale, largest
+
+
+#Running estimate of a single statistic
+def summarize(total, total_sq, count, scale, z, confidence=0.95, largest=1):
+    """
+    largest: bound on the value of a sample
+
+    returns: dictionary with the estimate, its confidence interval and the
+    relative half-width of the interval (inf while the estimate is 0)
+
+    Without any hit the normal interval degenerates to [0, 0]. The rule of
+    three then bounds the probability that a sample is nonzero by
+    -ln(1 - confidence) / count (3 / count at 95%), reported as "hit_rate",
+    and the count by scale * hit_rate * largest; "upper_bound" is set.
+    """
+    if total == 0:
+        hit_rate = -math.log(1 - confidence) / count
+        return {
+            "estimate": 0.0,
+            "low": 0.0,
+            "high": scale * min(hit_rate, 1.0) * largest,
+            "hit_rate": hit_rate,
+            "rel_error": float("inf"),
+            "samples": count,
+            "upper_bound": True,
+        }
+    mean = total / count
+    var = max(total_sq - count * mean * mean, 0.0) / (count - 1) if count > 1 else float("inf")
+    half = z * math.sqrt(var / count)
+    return {
+        "estimate": scale * mean,
+        "low": scale * max(mean - half, 0.0),
+        "high": scale * (mean + half),
+        "rel_error": half / mean if mean > 0 else float("inf"),
+        "samples": count,
+        "upper_bound": False,
+    }
+
+
+def estimate_statistics(C, q, stats=STATISTICS, rel_error=0.05, confidence=0.95,
+                        batch_size=2048, max_samples=None, time_budget=None,
+                        min_samples=10000, seed=None, verbose=False):
+    """
+    C: tensor as an int array of shape (n, m, k) with entries in [0, q)
+    q: field size (prime or prime power, see finite_field.py for the encoding)
+    stats: statistics to estimate (subset of STATISTICS)
+    rel_error: stop a statistic once its interval half-width is below
+        rel_error * estimate (and at least min_samples were drawn)
+    confidence: confidence level of the reported intervals
+    max_samples: sample budget per statistic
+    time_budget: wall clock budget in seconds for the whole run
+        (at least one of them is required: a statistic without any hit never
+        reaches rel_error)
+
+    returns: dictionary stat -> summary (see summarize), with an extra
+    "converged" flag telling whether the stopping rule was met. Statistics
+    without any hit never converge and only report an upper bound.
+    """
+    if max_samples is None and time_budget is None:
+        raise ValueError("Provide max_samples or time_budget: statistics without any hit never reach rel_error")
+    field = Fq(q)
+    rng = np.random.default_rng(seed)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    start = time.time()
+
+    #running sum, sum of squares and number of samples per statistic
+    acc = {stat: [0.0, 0.0, 0] for stat in stats}
+    results = {}
+    active = list(stats)
+    while active:
+        for stat in active:
+            values, scale, largest = sample_statistic(C, stat, rng, batch_size, field)
+            a = acc[stat]
+            a[0] += values.sum()
+            a[1] += (values * values).sum()
+            a[2] += len(values)
+            r = summarize(a[0], a[1], a[2], scale, z, confidence, largest)
+            r["converged"] = (rel_error is not None and r["samples"] >= min_samples
+                              and r["rel_error"] <= rel_error)
+            results[stat] = r
+
+        active = [stat for stat in active if not results[stat]["converged"]
+                  and (max_samples is None or results[stat]["samples"] < max_samples)]
+
+        if verbose:
+            elapsed = time.time() - start
+            print(f"[{elapsed:.1f}s] " + "  ".join(
+                f"{stat}: no hit (rate < {results[stat]['hit_rate']:.2g})" if results[stat]["upper_bound"] else
+                f"{stat}: {results[stat]['estimate']:.4g} (±{100 * results[stat]['rel_error']:.1f}%)"
+                for stat in stats))
+        if time_budget is not None and time.time() - start >= time_budget:
+            break
+    return results
+
+
+def argparser():
+    parser = argparse.ArgumentParser(
+        description="Estimates edge and 4-cycle counts of a tensor graph by sampling",
+        epilog="Example usage: python3 estimator.py -n=7 -m=7 -k=7 -q=13 --time=60 --verbose"
+    )
+    parser.add_argument("-n", type=int, default=5, help="Dimension n for the first vector space")
+    parser.add_argument("-m", type=int, default=5, help="Dimension m for the second vector space")
+    parser.add_argument("-k", type=int, default=5, help="Dimension k for the third vector space")
+    parser.add_argument("-q", type=int, default=13, help="Field size (prime or prime power)")
+    parser.add_argument("--stats", type=str, default=",".join(STATISTICS), help="Comma separated statistics among UV,UW,VW,A,B,C,D,E,F")
+    parser.add_argument("--rel_error", type=float, default=0.05, help="Target relative half-width of the confidence intervals")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals")
+    parser.add_argument("--samples", type=int, default=None, help="Sample budget per statistic")
+    parser.add_argument("--time", type=float, default=60, help="Time budget in seconds")
+    parser.add_argument("--batch", type=int, default=2048, help="Number of samples tested per vectorized batch")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the random tensor and of the sampler")
+    parser.add_argument("--load_tensor", type=str, default="", help="Loads tensor from file instead of generating a random one")
+    parser.add_argument("--verbose", action="store_true", help="Report convergence after every batch")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argparser()
+    q = args.q
+
+    if args.load_tensor == "":
+        C = np.random.default_rng(args.seed).integers(0, q, size=(args.n, args.m, args.k), dtype=np.int64)
+    else:
+        with open(args.load_tensor, 'r') as f:
+            C = np.array(ast.literal_eval(f.read()), dtype=np.int64) % q
+    n, m, k = C.shape
+
+    print(f"n={n} m={m} k={k} q={q}")
+    print(f"Sizes of projective spaces: U {projective_size(n, q)}, V {projective_size(m, q)}, W {projective_size(k, q)}")
+
+    results = estimate_statistics(C, q, stats=args.stats.split(","), rel_error=args.rel_error,
+                                  confidence=args.confidence, batch_size=args.batch,
+                                  max_samples=args.samples, time_budget=args.time,
+                                  seed=args.seed, verbose=args.verbose)
+
+    for stat, r in results.items():
+        name = f"{stat} edges" if stat in EDGE_TYPES else f"Type {stat} 4-cycles"
+        if r["upper_bound"]:
+            #no hit: only one-sided bounds are known
+            line = (f"{name}: no hit, hit probability below {r['hit_rate']:.3g} and count at most "
+                    f"{r['high']:.6g} at {100 * args.confidence:g}% confidence  ({r['samples']} samples")
+        else:
+            line = f"{name}: {r['estimate']:.6g}  [{r['low']:.6g}, {r['high']:.6g}]  ({r['samples']} samples"
+        if stat in EDGE_TYPES:
+            X, Z = EDGE_TYPES[stat]
+            density = r["estimate"] / (projective_size(C.shape[AXES[X]], q) * projective_size(C.shape[AXES[Z]], q))
+            line += f", density {density:.4g}"
+        print(line + ("" if r["converged"] else ", not converged") + ")")
@@ -0,0 +1,202 @@
+import numpy as np
+
+"""
+Table-driven arithmetic over finite fields F_q, q = p^e
+
+Elements are small integers in [0, q). For e > 1 the base-p digits of an
+integer are the coefficients of its polynomial representative, low degree
+first, as in Sage's F.from_integer / x.to_integer. Products go through
+log/antilog tables of a generator of F_q^*, sums are digit-wise mod p (xor
+for p = 2). For prime fields everything reduces to plain arithmetic mod p.
+All operations act element-wise on NumPy integer arrays.
+"""
+
+
+#Returns (p, e) with q = p^e, raises ValueError if q is not a prime power
+def factor_prime_power(q):
+    if q < 2:
+        raise ValueError(f"{q} is not a prime power")
+    p = next((d for d in range(2, int(q**0.5) + 1) if q % d == 0), q)
+    e = 0
+    r = q
+    while r % p == 0:
+        r //= p
+        e += 1
+    if r != 1:
+        raise ValueError(f"{q} is not a prime power")
+    return p, e
+
+
+#Remainder of the polynomial a modulo the monic polynomial f (coefficients low degree first, mod p)
+def _poly_mod(a, f, p):
+    a = list(a)
+    while len(a) >= len(f):
+        c = a[-1]
+        if c:
+            shift = len(a) - len(f)
+            for t in range(len(f)):
+                a[shift + t] = (a[shift + t] - c * f[t]) % p
+        a.pop()
+    return a
+
+
+#First monic irreducible polynomial of degree e over F_p (coefficients low degree first)
+def find_irreducible(p, e):
+    def monic(d, idx):
+        return [(idx // p**t) % p for t in range(d)] + [1]
+    for idx in range(p**e):
+        f = monic(e, idx)
+        if f[0] == 0:
+            continue
+        #no monic factor of degree 1..e/2
+        if all(any(_poly_mod(f, monic(d, j), p)) for d in range(1, e // 2 + 1) for j in range(p**d)):
+            return f
+    raise ValueError(f"No irreducible polynomial of degree {e} over F_{p}")
+
+
+class Fq:
+    """
+    Arithmetic tables of F_q
+
+    q: field size, a prime or a prime power
+    modulus: defining polynomial of F_q over F_p (coefficients low degree
+        first, monic, irreducible) when q is not prime; by default the first
+        one in lexicographic order. Use Fq.from_sage to share Sage's.
+    """
+    def __init__(self, q, modulus=None):
+        self.q = q
+        self.p, self.e = factor_prime_power(q)
+        if self.e > 1:
+            self.modulus = list(modulus) if modulus is not None else find_irreducible(self.p, self.e)
+        else:
+            self.modulus = None
+        self.powers = self.p ** np.arange(self.e, dtype=np.int64)
+
+        #exp[i] = g^i for a generator g (twice, so that log a + log b needs no reduction)
+        g = self._generator()
+        exp = np.zeros(2 * (q - 1), dtype=np.int64)
+        log = np.zeros(q, dtype=np.int64)
+        x = 1
+        for i in range(q - 1):
+            exp[i] = x
+            log[x] = i
+            x = self._mul_scalar(x, g)
+        exp[q - 1:] = exp[:q - 1]
+        self.exp = exp
+        self.log = log
+        self.inv_table = np.zeros(q, dtype=np.int64)
+        self.inv_table[1:] = exp[(q - 1 - log[1:]) % (q - 1)]
+
+    @classmethod
+    def from_sage(cls, F):
+        #Tables of a Sage finite field F, with the same integer encoding
+        if F.degree() > 1:
+            return cls(int(F.order()), [int(c) for c in F.modulus().list()])
+        return cls(int(F.order()))
+
+    #---- scalar helpers used to build the tables
+    def _mul_scalar(self, a, b):
+        if self.e == 1:
+            return a * b % self.p
+        da = [(a // self.p**t) % self.p for t in range(self.e)]
+        db = [(b // self.p**t) % self.p for t in range(self.e)]
+        prod = [0] * (2 * self.e - 1)
+        for s, x in enumerate(da):
+            for t, y in enumerate(db):
+                prod[s + t] = (prod[s + t] + x * y) % self.p
+        r = _poly_mod(prod, self.modulus, self.p)
+        return sum(c * self.p**t for t, c in enumerate(r))
+
+    def _pow_scalar(self, a, n):
+        r = 1
+        while n:
+            if n & 1:
+                r = self._mul_scalar(r, a)
+            a = self._mul_scalar(a, a)
+            n >>= 1
+        return r
+
+    def _generator(self):
+        order = self.q - 1
+        primes = [r for r in range(2, order + 1) if order % r == 0 and all(r % d for d in range(2, int(r**0.5) + 1))]
+        for g in range(1, self.q):
+            if all(self._pow_scalar(g, order // r) != 1 for r in primes):
+                return g
+        raise ValueError(f"No generator found for F_{self.q}")
+
+    #---- conversion from/to Sage elements
+    def to_int(self, x):
+        if self.e == 1 or isinstance(x, (int, np.integer)):
+            return int(x) % self.q
+        return sum(int(c) * self.p**t for t, c in enumerate(x.polynomial().list()))
+
+    def to_sage(self, F, a):
+        if self.e == 1:
+            return F(int(a))
+        return F.from_integer(int(a))
+
+    #---- vectorized arithmetic
+    def _digits(self, a):
+        return (np.asarray(a)[..., None] // self.powers) % self.p
+
+    def _from_digits(self, d):
+        return (d * self.powers).sum(axis=-1)
+
+    def add(self, a, b):
+        if self.e == 1:
+            return (a + b) % self.p
+        if self.p == 2:
+            return np.bitwise_xor(a, b)
+        return self._from_digits((self._digits(a) + self._digits(b)) % self.p)
+
+    def neg(self, a):
+        if self.e == 1:
+            return (-a) % self.p
+        if self.p == 2:
+            return np.asarray(a).copy()
+        return self._from_digits((-self._digits(a)) % self.p)
+
+    def sub(self, a, b):
+        if self.e == 1:
+            return (a - b) % self.p
+        return self.add(a, self.neg(b))
+
+    def mul(self, a, b):
+        if self.e == 1:
+            return (a * b) % self.p
+        a, b = np.broadcast_arrays(a, b)
+        return np.where((a == 0) | (b == 0), 0, self.exp[self.log[a] + self.log[b]])
+
+    def inv(self, a):
+        return self.inv_table[a]
+
+    def sum(self, a, axis):
+        #field sum of the entries of a along axis
+        a = np.asarray(a)
+        if self.e == 1:
+            return a.sum(axis=axis) % self.p
+        if self.p == 2:
+            return np.bitwise_xor.reduce(a, axis=axis)
+        axis = axis % a.ndim
+        return self._from_digits(self._digits(a).sum(axis=axis) % self.p)
+
+    def matmul(self, a, b):
+        #(..., r, d) x (..., d, c) -> (..., r, c), with broadcasting of the leading axes
+        if self.e == 1:
+            return np.matmul(a, b) % self.p
+        return self.sum(self.mul(a[..., :, :, None], b[..., None, :, :]), axis=-2)
+
+    def contract(self, x, T, axis):
+        """
+        x: (B, d) batch of vectors
+        T: array with T.shape[axis] = d
+
+        returns: (B, ...) array sum_t x[b, t] * T[..., t at axis, ...]
+        """
+        Tt = np.moveaxis(T, axis, 0)
+        rest = Tt.shape[1:]
+        return self.matmul(x, Tt.reshape(Tt.shape[0], -1)).reshape((len(x),) + rest)
+
+    def mode_product(self, T, M, axis):
+        #T'[.., p, ..] = sum_t T[.., t, ..] * M[t, p], the index p replacing t at axis
+        return np.moveaxis(self.contract(M.T, T, axis), 0, axis)
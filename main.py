@@ -2,9 +2,14 @@ import time
 import argparse
 from tensor import *
 from tools import *
+from out_of_core import gen_graph_out_of_core, print_out_of_core_stats
+from vectorized import tensor_to_array
+from finite_field import Fq
+from planner import plan_graph, print_plan
+from query import TensorGraphQuery
 from threading import Thread
 
-def argparser():
+def argparser(argv=None):
     #Parses the values of (n,m,k,q,labeled) as described
     parser = argparse.ArgumentParser(
         description="Build graph from a random 3-tensor",
@@ -13,7 +18,7 @@ def argparser():
     parser.add_argument("-n", type=int, default=4, help="Dimension n for the first vector space")
     parser.add_argument("-m", type=int, default=4, help="Dimension m for the second vector space")
     parser.add_argument("-k", type=int, default=4, help="Dimension k for the third vector space")
-    parser.add_argument("-q", type=int, default=5, help="Prime field size")
+    parser.add_argument("-q", type=int, default=5, help="Field size (prime or prime power)")
     parser.add_argument("-c", type=int, default=None, help="Highlights all cycles of length c in the final graph")
     parser.add_argument("--loose", action="store_true", help="Highlights all cycles of length 2 < c' <= c")
     parser.add_argument("--deg_ubound", type=int, default=1000, help="Filters all nodes of degree greater or equal than specified")
@@ -26,11 +31,21 @@ def argparser():
     parser.add_argument("--minimal", action="store_true", help="Only prints in terminal the random tensor, and, if enabled, all cycles of various lengths")
     parser.add_argument("--load_tensor", type=str, default="", help="Loads tensor from file instead of generating a random one")
     parser.add_argument("--load_graph", type=str, default="", help="Loads tensor graph from file instead of calculating one given a random tensor [TODO]")
-    return parser.parse_args()
-
-def gen_graph(T, n,m,k, F, deg_0, l_bound, u_bound,verbose,minimal=False):
+    parser.add_argument("--out_of_core", action="store_true", help="Enumerates edges in blocks spilled to disk instead of building the graph in memory (statistics only)")
+    parser.add_argument("--memory_limit", "--memory-limit", type=int, default=1024, help="Peak memory (MB) allowed in --out_of_core mode")
+    parser.add_argument("--work_dir", type=str, default="", help="Directory for the --out_of_core degree counters and edge runs (temporary by default)")
+    parser.add_argument("--edge_file", type=str, default="", help="Writes the filtered edges of --out_of_core mode to this file")
+    parser.add_argument("--ego_point", type=str, default="", help="Only builds and displays the ego-graph of this point, given as comma separated coordinates or as a vertex label")
+    parser.add_argument("--ego_partition", type=str, default="U", choices=["U", "V", "W"], help="Space of --ego_point when given by coordinates")
+    parser.add_argument("--ego_radius", type=int, default=1, help="Radius of the ego-graph")
+    parser.add_argument("--ego_max_vertices", type=int, default=1000, help="Stops the ego-graph exploration after this many vertices")
+    parser.add_argument("--engine", type=str, default="auto", choices=["auto"] + ENGINES, help="Graph construction and isometry engine; auto picks the fastest with the cost model of planner.py")
+    return parser.parse_args(argv)
+
+def gen_graph(T, n,m,k, F, deg_0, l_bound, u_bound,verbose,minimal=False, engine="vectorized",
+              block=VECTORIZED_BLOCK, chunk=VECTORIZED_CHUNK):
     start = time.time()
-    G = tensor_to_graph(T, n, m, k, F, verbose, minimal)
+    G = tensor_to_graph(T, n, m, k, F, verbose, minimal, engine, block, chunk)
     if not(minimal):
         print(f"Computation time: {time.time() - start}")
     print("Tensor T:")
@@ -47,6 +62,43 @@ def gen_graph(T, n,m,k, F, deg_0, l_bound, u_bound,verbose,minimal=False):
         print("\nGraph edges: ")
         print(G.edges())
 
+    filter_by_degree(G, deg_0, l_bound, u_bound, minimal)
+    return G
+
+#Ego-graph of a point, computed lazily without building the graph of T
+def gen_ego_graph(T, n,m,k, F, point, partition, radius, max_vertices, verbose, minimal=False):
+    start = time.time()
+    Q = TensorGraphQuery.from_tensor(T, F)
+    #a single integer is a vertex label, several are coordinates
+    coords = [int(x) for x in point.split(",")]
+    center = coords[0] if len(coords) == 1 else Q.label(coords, partition)
+    distance, edges = Q.ego_graph(center, radius=radius, max_vertices=max_vertices)
+    G = Graph(multiedges=False)
+    G.add_vertices(list(distance))
+    G.add_edges(edges)
+    if not(minimal):
+        X, p = Q.coordinates(center)
+        print(f"Ego-graph of vertex {center} ({X} point {tuple(int(x) for x in p)}), radius {radius}")
+        print(f"Vertices: {G.order()}, edges: {G.size()}, degree of center: {Q.degree(center)}")
+        print(f"Computation time: {time.time() - start}")
+    if verbose and not(minimal):
+        print(f"Neighbourhood cache: {Q.cache_info()}")
+        for v in sorted(distance):
+            X, p = Q.coordinates(v)
+            print(v, X, tuple(int(x) for x in p), f"distance {distance[v]}")
+    return G, center
+
+#Resolves --engine auto with the cost model of planner.py
+def choose_engine(args, T, n, m, k, q, out_of_core=True):
+    if args.engine != "auto":
+        return {"engine": args.engine, "block": VECTORIZED_BLOCK, "chunk": VECTORIZED_CHUNK}
+    plan = plan_graph(n, m, k, q, round(density(T) * n * m * k), out_of_core=out_of_core)
+    if args.verbose and not(args.minimal):
+        print_plan(plan)
+    return plan
+
+#Removes from G the vertices of degree <= l_bound or >= u_bound
+def filter_by_degree(G, deg_0, l_bound, u_bound, minimal=False):
     #Identify vertices inside upper and lower bound
     if not(minimal):
         print("Removing vertices of out-of-range degree")
@@ -59,8 +111,6 @@ def gen_graph(T, n,m,k, F, deg_0, l_bound, u_bound,verbose,minimal=False):
             out_of_bounds.append(v)
     G.delete_vertices(out_of_bounds)
 
-    return G
-
 if __name__ == "__main__":
     args = argparser()
     
@@ -70,8 +120,8 @@ if __name__ == "__main__":
     k = args.k
     #Field size
     q = args.q
-    #Field
-    F = GF(q)  
+    #Field (GF(p^e) is generated by a)
+    F = GF(q, 'a')
 
     #Show graph labels?
     labeled = args.labeled
@@ -108,8 +158,37 @@ if __name__ == "__main__":
     else:
         T = parse_tensor_from_file(file_t, q)
 
-
-    G = gen_graph(T, n,m,k, F, deg_0, l_bound, u_bound,verbose, minimal)
+    #Local exploration: only the ego-graph of one point is computed
+    if args.ego_point != "":
+        G, center = gen_ego_graph(T, n,m,k, F, args.ego_point, args.ego_partition, args.ego_radius,
+                                  args.ego_max_vertices, verbose, minimal)
+        graph_display(G,n,m,k,q,labeled=labeled, cycle=cycle_size, loose=loose, minimal=minimal, center=center)
+        exit()
+
+    #Engine, chunk sizes, and out-of-core mode if the graph cannot fit in memory
+    if not(args.out_of_core):
+        plan = choose_engine(args, T, n, m, k, q)
+        if plan["engine"] == "out_of_core":
+            if not(minimal):
+                print(f"Expected graph does not fit in memory, switching to --out_of_core (--memory_limit={plan['memory_limit']})")
+            args.out_of_core = True
+            args.memory_limit = plan["memory_limit"]
+        engine = plan["engine"]
+
+    #Graphs larger than memory: only statistics are computed
+    if args.out_of_core:
+        field = Fq.from_sage(F)
+        stats = gen_graph_out_of_core(tensor_to_array(T, field), field, l_bound, u_bound, args.memory_limit,
+                                      work_dir=args.work_dir, edge_file=args.edge_file,
+                                      verbose=verbose, minimal=minimal)
+        print("Tensor T:")
+        for i in range(n):
+            print(T[i])
+            print()
+        print_out_of_core_stats(stats)
+        exit()
+
+    G = gen_graph(T, n,m,k, F, deg_0, l_bound, u_bound,verbose, minimal, engine, plan["block"], plan["chunk"])
 
     #Display graph
     graph_display(G,n,m,k,q,labeled=labeled, cycle=cycle_size, loose=loose, minimal=minimal)
@@ -135,10 +214,10 @@ if __name__ == "__main__":
             print(C)
         
         #Apply isometry: T2 = T(A,B,C)
-        T2 = apply_isometry(T, A, B, C)
+        T2 = apply_isometry(T, A, B, C, engine)
         
         #Generate graph and filter nodes based on cmd line arguments
-        G2 = gen_graph(T2, n,m,k, F, deg_0, l_bound, u_bound,verbose, minimal)
+        G2 = gen_graph(T2, n,m,k, F, deg_0, l_bound, u_bound,verbose, minimal, engine, plan["block"], plan["chunk"])
 
         #Display graph
         graph_display(G2,n,m,k,q, labeled=labeled, cycle=cycle_size, loose=loose, minimal=minimal)
@@ -0,0 +1,299 @@
+import os
+import time
+import shutil
+import resource
+import tempfile
+import numpy as np
+from vectorized import *
+
+"""
+Out-of-core construction of tensor graphs
+
+The neighbours of a point x in P(X) towards P(Z) are the projective points of
+the kernel of the contraction C(x, -, -), so edges are enumerated block by
+block of X points without ever testing all pairs. Degrees are accumulated in
+a memory-mapped counter array and edges are spilled to sorted runs on disk;
+degree filtering and statistics are computed by streaming over those runs.
+
+Vertex ids follow the layout of tensor_to_graph: all of P(U), then P(V), then
+P(W). An edge (a, b) with a < b is stored as the packed key a * N + b where N
+is the total number of vertices.
+"""
+
+EDGE_KINDS = [("U", "V"), ("U", "W"), ("V", "W")]
+
+#Bytes of a packed edge key
+EDGE_BYTES = 8
+#Largest N such that every packed key a * N + b with a, b < N fits in an int64
+MAX_VERTICES = 3037000499
+
+
+#Offset of each projective space in the vertex ids and number of vertices
+def vertex_offsets(C, q):
+    sizes = {X: projective_size(C.shape[a], q) for X, a in AXES.items()}
+    offsets = {"U": 0, "V": sizes["U"], "W": sizes["U"] + sizes["V"]}
+    return offsets, sizes, sum(sizes.values())
+
+
+#Peak resident set size of this process so far, in bytes
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def plan_memory(C, field, memory_limit):
+    """
+    memory_limit: bound on the peak RSS of the process, in MB
+
+    returns: dictionary with the number of X points per block, the number of
+    edges per sorted run and the chunk size (elements) of the kernel
+    enumeration and of the streaming passes
+    """
+    _, _, N = vertex_offsets(C, field.q)
+    if N > MAX_VERTICES:
+        raise ValueError(f"{N} vertices overflow the int64 edge keys of the out-of-core mode "
+                         f"(at most {MAX_VERTICES})")
+    #degrees, filtered degrees and the kept-vertex mask can all be resident
+    counters = 9 * N
+    available = memory_limit * 2**20 - peak_rss() - counters
+    if available <= 0:
+        raise ValueError(f"--memory_limit={memory_limit} MB is below the process footprint "
+                         f"({(peak_rss() + counters) / 2**20:.0f} MB including degree counters)")
+    #a quarter for the run buffer, half for the block working set
+    run_edges = max(1, available // 4 // (2 * EDGE_BYTES))
+    block, chunk = working_set_sizes(available // 2, max(C.shape), field.e)
+    return {"block": block, "run_edges": int(run_edges), "chunk": chunk}
+
+
+#Block and chunk sizes of edge_blocks fitting in a working set
+def working_set_sizes(working, dmax, e):
+    """
+    working: bytes for the contractions, eliminations and kernel points
+    dmax: largest dimension of the tensor
+    e: degree of F_q over its prime field
+
+    returns: (block, chunk) with the number of X points per block and the
+    number of coordinates materialized at once by the kernel enumeration
+    """
+    #products over prime power fields are materialized before being summed
+    expand = dmax if e > 1 else 1
+    chunk = max(1024, working // (8 * 8 * expand))
+    #contraction and elimination copies plus the kernel basis of one point
+    per_point = 8 * (4 * dmax * dmax * expand + 2 * dmax * dmax)
+    block = max(1, working // per_point)
+    return int(block), int(chunk)
+
+
+#Generator of the edges between P(X) and P(Z), in blocks of X points
+def edge_blocks(C, field, X, Z, block, chunk):
+    """
+    C: tensor as an int array of shape (n, m, k)
+
+    yields: (x, z) arrays of indices in P(X) and P(Z), ordering of projective_points
+    """
+    q = field.q
+    dX = C.shape[AXES[X]]
+    NX = projective_size(dX, q)
+    for start in range(0, NX, block):
+        x = projective_points(dX, q, start, min(start + block, NX))
+        M = neighbour_constraints(C, x, X, Z, field)
+        for items, P in iter_kernel_points(M, field, chunk):
+            yield start + items, projective_index(P, q)
+
+
+#Adds ids to a memory-mapped counter array
+def add_counts(counter, ids):
+    uniq, cnt = np.unique(ids, return_counts=True)
+    counter[uniq] += cnt.astype(counter.dtype)
+
+
+#Writes a sorted run of packed edge keys
+def spill(buffer, work_dir, runs):
+    keys = np.sort(np.concatenate(buffer))
+    path = os.path.join(work_dir, f"run_{len(runs):05d}.npy")
+    np.save(path, keys)
+    runs.append(path)
+    buffer.clear()
+
+
+def build_out_of_core(C, field, work_dir, plan, verbose=False, minimal=False):
+    """
+    Enumerates every edge of the graph of C
+
+    returns: dictionary with the vertex layout, the number of edges of each
+    kind, the degree counter file and the list of sorted runs
+    """
+    offsets, sizes, N = vertex_offsets(C, field.q)
+    degrees = np.lib.format.open_memmap(os.path.join(work_dir, "degrees.npy"), mode="w+",
+                                        dtype=np.uint32, shape=(N,))
+    runs = []
+    buffer = []
+    buffered = 0
+    edges = {}
+    for X, Z in EDGE_KINDS:
+        if not minimal:
+            print(f"Enumerating {X} {Z} edges")
+        start = time.time()
+        edges[X + Z] = 0
+        for x, z in edge_blocks(C, field, X, Z, plan["block"], plan["chunk"]):
+            a = x + offsets[X]
+            b = z + offsets[Z]
+            add_counts(degrees, a)
+            add_counts(degrees, b)
+            buffer.append(a * N + b)
+            buffered += len(a)
+            edges[X + Z] += len(a)
+            if buffered >= plan["run_edges"]:
+                spill(buffer, work_dir, runs)
+                buffered = 0
+        if verbose and not minimal:
+            print(f"{edges[X + Z]} edges in {time.time() - start:.2f}s, {len(runs)} runs so far")
+    if buffer:
+        spill(buffer, work_dir, runs)
+    degrees.flush()
+    return {"offsets": offsets, "sizes": sizes, "vertices": N, "edges": edges,
+            "degrees": degrees.filename, "runs": runs}
+
+
+#Streams the packed keys of all runs in blocks
+def iter_run_blocks(runs, chunk):
+    for path in runs:
+        keys = np.load(path, mmap_mode="r")
+        for start in range(0, len(keys), chunk):
+            yield np.array(keys[start:start + chunk])
+
+
+#Streams the edges of all runs as one globally sorted sequence of blocks
+def iter_sorted_edges(runs, chunk):
+    """
+    k-way merge of the sorted runs: every round emits all buffered keys up to
+    the smallest last key among the runs that still have data
+    """
+    per_run = max(1, chunk // max(1, len(runs)))
+    sources = [iter_run_blocks([path], per_run) for path in runs]
+    heads = [next(src, None) for src in sources]
+    while any(h is not None for h in heads):
+        bound = min(h[-1] for h in heads if h is not None)
+        out = []
+        for idx, h in enumerate(heads):
+            if h is None:
+                continue
+            cut = np.searchsorted(h, bound, side="right")
+            out.append(h[:cut])
+            rest = h[cut:]
+            heads[idx] = rest if len(rest) else next(sources[idx], None)
+        yield np.sort(np.concatenate(out))
+
+
+#Histogram of a counter array (restricted to mask if given), chunk by chunk
+def counter_histogram(counter, chunk, mask=None):
+    hist = np.zeros(1, dtype=np.int64)
+    for start in range(0, len(counter), chunk):
+        values = counter[start:start + chunk]
+        if mask is not None:
+            values = values[mask[start:start + chunk]]
+        h = np.bincount(values)
+        if len(h) > len(hist):
+            h[:len(hist)] += hist
+            hist = h
+        else:
+            hist[:len(h)] += h
+    return hist
+
+
+def filter_out_of_core(graph, work_dir, l_bound, u_bound, chunk, edge_file=""):
+    """
+    Removes vertices v with deg(v) <= l_bound or deg(v) >= u_bound (as in
+    gen_graph) by streaming over the runs
+    edge_file: if given, the remaining edges are written there as sorted
+    "a b" lines of tensor_to_graph labels (vertex id + 1)
+
+    returns: dictionary of statistics of the filtered graph
+    """
+    N = graph["vertices"]
+    degrees = np.load(graph["degrees"], mmap_mode="r")
+    keep = np.lib.format.open_memmap(os.path.join(work_dir, "keep.npy"), mode="w+",
+                                     dtype=bool, shape=(N,))
+    for start in range(0, N, chunk):
+        deg = degrees[start:start + chunk]
+        keep[start:start + chunk] = (deg > l_bound) & (deg < u_bound)
+    filtered = np.lib.format.open_memmap(os.path.join(work_dir, "filtered_degrees.npy"), mode="w+",
+                                         dtype=np.uint32, shape=(N,))
+
+    bounds = [graph["offsets"]["V"], graph["offsets"]["W"]]
+    edges = {X + Z: 0 for X, Z in EDGE_KINDS}
+    for keys in iter_run_blocks(graph["runs"], chunk):
+        a = keys // N
+        b = keys % N
+        sel = keep[a] & keep[b]
+        a, b = a[sel], b[sel]
+        add_counts(filtered, a)
+        add_counts(filtered, b)
+        #partition of each endpoint: 0 = U, 1 = V, 2 = W
+        pa = np.searchsorted(bounds, a, side="right")
+        pb = np.searchsorted(bounds, b, side="right")
+        for X, Z in EDGE_KINDS:
+            edges[X + Z] += int(((pa == "UVW".index(X)) & (pb == "UVW".index(Z))).sum())
+    filtered.flush()
+
+    if edge_file != "":
+        with open(edge_file, "w") as f:
+            for keys in iter_sorted_edges(graph["runs"], chunk):
+                a = keys // N
+                b = keys % N
+                sel = keep[a] & keep[b]
+                np.savetxt(f, np.stack([a[sel] + 1, b[sel] + 1], axis=1), fmt="%d")
+
+    vertices = sum(int(keep[start:start + chunk].sum()) for start in range(0, N, chunk))
+    return {"vertices": vertices, "edges": edges,
+            "degree_histogram": counter_histogram(degrees, chunk),
+            "filtered_degree_histogram": counter_histogram(filtered, chunk, keep)}
+
+
+def gen_graph_out_of_core(C, field, l_bound, u_bound, memory_limit, work_dir="", edge_file="",
+                          verbose=False, minimal=False):
+    """
+    Out-of-core counterpart of gen_graph: builds the graph of C on disk,
+    filters it by degree and returns its statistics
+
+    C: tensor as an int array of shape (n, m, k)
+    field: Fq tables of the field of the entries
+    memory_limit: bound on the peak RSS, in MB
+    work_dir: directory of the runs and counters (by default a temporary
+    directory, removed at the end)
+    edge_file: optional text file receiving the filtered edges
+    """
+    plan = plan_memory(C, field, memory_limit)
+    if verbose and not minimal:
+        print(f"Out-of-core plan: {plan}")
+    tmp = work_dir == ""
+    if tmp:
+        work_dir = tempfile.mkdtemp(prefix="tensor_graph_")
+    else:
+        os.makedirs(work_dir, exist_ok=True)
+    try:
+        graph = build_out_of_core(C, field, work_dir, plan, verbose, minimal)
+        if not minimal:
+            print("Removing vertices of out-of-range degree")
+        stats = filter_out_of_core(graph, work_dir, l_bound, u_bound, plan["chunk"], edge_file)
+    finally:
+        if tmp:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    stats["sizes"] = graph["sizes"]
+    stats["total_edges"] = graph["edges"]
+    stats["peak_rss_mb"] = peak_rss() / 2**20
+    return stats
+
+
+#Prints the statistics returned by gen_graph_out_of_core
+def print_out_of_core_stats(stats):
+    print("Sizes of projective Spaces:")
+    for X, size in stats["sizes"].items():
+        print(f"{X} : {size}")
+    print(f"Edges: {stats['total_edges']}")
+    hist = stats["degree_histogram"]
+    print(f"Max degree: {len(hist) - 1}, mean degree: {(hist * np.arange(len(hist))).sum() / hist.sum():.4f}")
+    print(f"After degree filtering: {stats['vertices']} vertices, edges {stats['edges']}")
+    hist = stats["filtered_degree_histogram"]
+    print("Degree histogram after filtering (degree: vertices): " +
+          ", ".join(f"{d}: {c}" for d, c in enumerate(hist) if c))
+    print(f"Peak RSS: {stats['peak_rss_mb']:.1f} MB")
@@ -0,0 +1,403 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import numpy as np
+from finite_field import factor_prime_power
+from vectorized import projective_size
+from out_of_core import working_set_sizes
+
+"""
+Cost model and engine planner
+
+Estimates the running time of each graph construction engine of tensor.py
+and of the Groebner solver from the sizes of the projective spaces, the
+number of nonzero entries of the tensor, the expected number of edges and
+the cores and memory of the machine, then picks the engine, the number of
+workers and the chunk sizes. The constants of the model are fitted on the
+local machine by `sage planner.py calibrate` and stored in COSTS_FILE.
+"""
+
+#Calibrated constants, overridable with the TENSOR_GRAPH_COSTS environment variable
+COSTS_FILE = os.environ.get("TENSOR_GRAPH_COSTS",
+                            os.path.join(os.path.expanduser("~"), ".cache", "tensor_graph", "costs.json"))
+
+#Uncalibrated defaults: seconds per unit of work, bytes per item
+DEFAULT_COSTS = {
+    "sage_term": 4e-7,          #one multiply-add of the dense vanishing test
+    "sparse_term": 8e-7,        #one nonzero entry of the sparse vanishing test
+    "pair": 1e-6,               #Python overhead of one tested pair
+    "vectorized_term": 2e-9,    #one multiply-add of a contraction or elimination
+    "edge": 3e-6,               #one edge emitted and added to a Sage graph
+    "vertex_bytes": 600,        #memory of a Sage graph vertex
+    "edge_bytes": 150,          #memory of a Sage graph edge
+    "eq_dense_term": 2e-6,      #one term of a dense edge equation
+    "eq_sparse_term": 3e-6,     #one nonzero term of a sparse edge equation
+    "gb_scale": 5e-3,           #Groebner cost of a system: gb_scale * q^(gb_rate * free coordinates)
+    "gb_rate": 0.5,
+    "worker_start": 0.5,        #start of a pool worker process
+    "worker_bytes": 400 * 2**20,
+}
+
+#Fraction of the available memory the planner lets a run use
+MEMORY_SHARE = 0.5
+
+
+#Calibrated constants (defaults for missing ones)
+def load_costs(path=COSTS_FILE):
+    costs = dict(DEFAULT_COSTS)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            costs.update(json.load(f))
+    return costs
+
+
+def save_costs(costs, path=COSTS_FILE):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(costs, f, indent=2, sort_keys=True)
+
+
+#Memory available to new allocations, in bytes
+def available_memory():
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+#Current resident set size, in bytes
+def current_rss():
+    with open("/proc/self/statm", "r") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+#Expected number of edges between P(X) and P(Z), dim Y being the number of conditions
+def expected_edges(dX, dZ, dY, q, density=1.0):
+    """
+    density: fraction of nonzero entries of the tensor
+
+    Exact expectation for a tensor whose entries are independently 0 with
+    probability 1 - density and uniform in F_q^* otherwise. For x, z with s
+    and t nonzero coordinates, each of the dY conditions is a sum of s * t
+    such terms, so it vanishes with probability 1/q + (1 - 1/q) mu^(s t) with
+    mu = 1 - density * q / (q - 1); sparse tensors have many more edges
+    than the q^-dY of dense ones.
+    """
+    mu = 1 - density * q / (q - 1)
+    #number of projective points with s nonzero coordinates
+    def weight(d, s):
+        return math.comb(d, s) * float(q - 1)**(s - 1)
+    return sum(weight(dX, s) * weight(dZ, t) * (1 / q + (1 - 1 / q) * mu**(s * t))**dY
+               for s in range(1, dX + 1) for t in range(1, dZ + 1))
+
+
+def graph_work(n, m, k, q, nonzero=None):
+    """
+    Units of work of the graph construction engines
+
+    nonzero: number of nonzero entries of the tensor (default: dense)
+
+    returns: dictionary with the number of tested pairs, multiply-adds of the
+    dense and sparse vanishing tests, multiply-adds of the vectorized engine,
+    expected edges and vertices
+    """
+    if nonzero is None:
+        nonzero = n * m * k
+    density = nonzero / (n * m * k)
+    _, e = factor_prime_power(q)
+    dims = {"U": n, "V": m, "W": k}
+    #products over prime power fields are materialized before being summed
+    expand = max(n, m, k) if e > 1 else 1
+    work = {"pairs": 0, "sage": 0, "sparse": 0, "vectorized": 0, "edges": 0,
+            "vertices": sum(projective_size(d, q) for d in dims.values())}
+    for X, Z, Y in [("U", "V", "W"), ("U", "W", "V"), ("V", "W", "U")]:
+        NX, NZ = projective_size(dims[X], q), projective_size(dims[Z], q)
+        dX, dY, dZ = dims[X], dims[Y], dims[Z]
+        pairs = NX * NZ
+        work["pairs"] += pairs
+        #a non-edge is usually rejected by the first condition
+        work["sage"] += pairs * dX * dZ
+        work["sparse"] += pairs * nonzero / dY
+        work["vectorized"] += NX * (dX * dY * dZ + dY * dZ * min(dY, dZ)) * expand
+        work["edges"] += expected_edges(dX, dZ, dY, q, density)
+    return work
+
+
+def plan_graph(n, m, k, q, nonzero=None, out_of_core=True, memory=None, costs=None):
+    """
+    Chooses the graph construction engine of main.py
+
+    out_of_core: allow the out-of-core mode when the graph does not fit in memory
+    memory: available memory in bytes (default: measured)
+
+    returns: dictionary with "engine" among vectorized, sparse, sage and
+    out_of_core, "workers", "block" and "chunk" of the vectorized engine,
+    "memory_limit" (MB) of the out-of-core mode and the estimates behind them
+    """
+    costs = costs or load_costs()
+    memory = memory or available_memory()
+    work = graph_work(n, m, k, q, nonzero)
+    build = costs["edge"] * work["edges"]
+    estimates = {
+        "vectorized": costs["vectorized_term"] * work["vectorized"] + build,
+        "sparse": costs["pair"] * work["pairs"] + costs["sparse_term"] * work["sparse"] + build,
+        "sage": costs["pair"] * work["pairs"] + costs["sage_term"] * work["sage"] + build,
+    }
+    graph_bytes = costs["vertex_bytes"] * work["vertices"] + costs["edge_bytes"] * work["edges"]
+    budget = MEMORY_SHARE * memory
+
+    _, e = factor_prime_power(q)
+    dmax = max(n, m, k)
+    #the graph stays resident, half of the rest is the working set as in out_of_core.plan_memory
+    working = max(budget - graph_bytes, budget / 4) // 2
+    block, chunk = working_set_sizes(int(working), dmax, e)
+    block = min(block, projective_size(dmax, q))
+
+    engine = min(estimates, key=estimates.get)
+    if out_of_core and graph_bytes > budget:
+        engine = "out_of_core"
+    return {"engine": engine, "workers": 1, "block": block, "chunk": chunk,
+            "memory_limit": int(budget // 2**20), "estimates": estimates,
+            "edges": work["edges"], "pairs": work["pairs"],
+            "graph_mb": graph_bytes / 2**20, "available_mb": memory / 2**20}
+
+
+def plan_solver(n, m, k, q, nonzero, systems, groups=1, exists=False, cores=None, memory=None, costs=None):
+    """
+    Chooses the equation representation and the parallelism of groebner_solver.py
+
+    nonzero: number of nonzero entries of the tensor
+    systems: number of free coordinates of every walk system to solve
+    groups: number of tasks the systems are split into (charts sharing a wedge)
+    exists: the run stops at the first system with a solution
+
+    returns: dictionary with "engine" (dense or sparse equations), "workers",
+    "chunksize" of the task queue and the estimates behind them
+    """
+    costs = costs or load_costs()
+    cores = cores or os.cpu_count() or 1
+    memory = memory or available_memory()
+    #every system builds the equations of two wedges of two edges each
+    edges = 4 * len(systems)
+    estimates = {
+        "dense": costs["eq_dense_term"] * edges * n * m * k,
+        "sparse": costs["eq_sparse_term"] * edges * nonzero,
+    }
+    engine = min(estimates, key=estimates.get)
+    solve = sum(costs["gb_scale"] * float(q)**(costs["gb_rate"] * v) for v in systems)
+    total = solve + estimates[engine]
+
+    #no more workers than cores, tasks, memory, or than the work can amortize
+    workers = max(1, min(cores, groups,
+                         int(MEMORY_SHARE * memory // costs["worker_bytes"]),
+                         int(total // costs["worker_start"])))
+    chunksize = 1 if exists else max(1, groups // (4 * workers))
+    return {"engine": engine, "workers": workers, "chunksize": chunksize,
+            "estimates": estimates, "seconds": total / workers + (costs["worker_start"] if workers > 1 else 0),
+            "systems": len(systems), "groups": groups}
+
+
+def print_plan(plan):
+    options = ", ".join(f"{key}={plan[key]}" for key in ("engine", "workers", "block", "chunk", "chunksize", "memory_limit")
+                        if key in plan)
+    print(f"Plan: {options}")
+    print("Estimated seconds: " + ", ".join(f"{name} {t:.3g}" for name, t in plan["estimates"].items()))
+    if "edges" in plan:
+        print(f"Expected edges: {plan['edges']:.4g} (edge density {plan['edges'] / plan['pairs']:.3g}), "
+              f"graph memory {plan['graph_mb']:.4g} MB of {plan['available_mb']:.0f} MB available")
+    if "systems" in plan:
+        print(f"Groebner systems: {plan['systems']} in {plan['groups']} tasks, about {plan['seconds']:.3g} s")
+
+
+#---------------------------
+# Calibration
+#---------------------------
+#Least squares fit of t = sum_i c_i x_i with c_i >= 0 (columns fitted alone when the joint fit is negative)
+def fit_linear(X, t):
+    X = np.asarray(X, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+    #relative errors: every run weighs the same whatever its duration
+    w = 1 / t
+    c, *_ = np.linalg.lstsq(X * w[:, None], t * w, rcond=None)
+    if (c > 0).all():
+        return c
+    return np.array([max((X[:, i] * t).sum() / (X[:, i]**2).sum(), 1e-12) for i in range(X.shape[1])])
+
+
+#Random tensor over F with about density * n * m * k nonzero entries
+def random_tensor(F, n, m, k, density=1.0):
+    return [[[F.random_element() if random.random() < density else F(0) for _ in range(k)]
+             for _ in range(m)] for _ in range(n)]
+
+
+def calibrate_graph(configs, costs, verbose=False):
+    from sage.all import GF
+    from tensor import tensor_to_graph, density
+    rows = {"vectorized": ([], []), "sparse": ([], []), "sage": ([], [])}
+    for n, m, k, q, fill in configs:
+        F = GF(q, 'a')
+        T = random_tensor(F, n, m, k, fill)
+        work = graph_work(n, m, k, q, round(density(T) * n * m * k))
+        for engine in rows:
+            start = time.time()
+            G = tensor_to_graph(T, n, m, k, F, minimal=True, engine=engine)
+            elapsed = time.time() - start
+            edges = G.size()
+            if engine == "vectorized":
+                rows[engine][0].append([work["vectorized"], edges])
+            else:
+                rows[engine][0].append([work["pairs"], work[engine], edges])
+            rows[engine][1].append(max(elapsed, 1e-6))
+            if verbose:
+                print(f"n={n} m={m} k={k} q={q} density={fill}: {engine} {elapsed:.3f}s, {edges} edges")
+            del G
+
+    costs["vectorized_term"], costs["edge"] = fit_linear(*rows["vectorized"])
+    pair_sparse, costs["sparse_term"], _ = fit_linear(*rows["sparse"])
+    pair_sage, costs["sage_term"], _ = fit_linear(*rows["sage"])
+    costs["pair"] = (pair_sparse + pair_sage) / 2
+
+
+#Resident memory of a Sage graph with random edges, built in a fresh process
+def graph_memory(config):
+    from sage.all import Graph
+    vertices, edges = config
+    rng = np.random.default_rng(0)
+    a = rng.integers(0, vertices, size=edges)
+    b = (a + rng.integers(1, vertices, size=edges)) % vertices
+    pairs = list(zip(a.tolist(), b.tolist()))
+    before = current_rss()
+    G = Graph(vertices)
+    G.add_edges(pairs)
+    return G.order(), G.size(), current_rss() - before
+
+
+def calibrate_memory(configs, costs, verbose=False):
+    """
+    Fits vertex_bytes and edge_bytes on graphs large enough for the RSS to
+    be dominated by the graph rather than by allocator noise. The defaults
+    are kept when the fit is not plausible.
+    """
+    import multiprocessing
+    #one process per graph: freed memory is not returned to the system
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        runs = pool.map(graph_memory, configs, chunksize=1)
+    if verbose:
+        for order, size, used in runs:
+            print(f"Graph with {order} vertices and {size} edges: {used / 2**20:.1f} MB")
+    vertex_bytes, edge_bytes = fit_linear([[order, size] for order, size, _ in runs],
+                                          [max(used, 1) for _, _, used in runs])
+    if vertex_bytes < MIN_ITEM_BYTES or edge_bytes < MIN_ITEM_BYTES:
+        if verbose:
+            print(f"Implausible memory fit ({vertex_bytes:.3g} B/vertex, {edge_bytes:.3g} B/edge), "
+                  "keeping the previous values")
+        return
+    costs["vertex_bytes"], costs["edge_bytes"] = vertex_bytes, edge_bytes
+
+
+def calibrate_solver(configs, costs, verbose=False):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.join(here, "square_solver"))
+    import groebner_solver
+    from sage.all import GF
+    from sparse_tensor import to_sparse
+    groebner_solver.verbose = False
+
+    sizes, seconds = [], []
+    eq_rows = ([], [])
+    for n, m, k, q, fill in configs:
+        F = GF(q, 'a')
+        C = random_tensor(F, n, m, k, fill)
+        S = to_sparse(C)
+        R, layout = groebner_solver.shared_ring(n, m, k, q)
+        u = groebner_solver.slot_point(R, layout, "u", (1,))
+        v = groebner_solver.slot_point(R, layout, "v", (1,))
+        for form, terms in ((C, n * m * k), (S, len(S.entries))):
+            start = time.time()
+            for _ in range(10):
+                groebner_solver.edge_UV(form, u, v, n, m, k, R)
+            eq_rows[0].append([terms, 0] if form is C else [0, terms])
+            eq_rows[1].append(max((time.time() - start) / 10, 1e-6))
+        for type_ in groebner_solver.WALKS:
+            pivots = groebner_solver.walk_charts(type_, n, m, k)[0]
+            start = time.time()
+            groebner_solver.chart_closed_walks(C, n, m, k, q, type_, pivots, {})
+            elapsed = max(time.time() - start, 1e-6)
+            sizes.append(groebner_solver.chart_size(type_, pivots, n, m, k) * math.log(q))
+            seconds.append(elapsed)
+            if verbose:
+                print(f"n={n} m={m} k={k} q={q}: type {type_} chart {pivots} {elapsed:.3f}s")
+
+    costs["eq_dense_term"], costs["eq_sparse_term"] = fit_linear(*eq_rows)
+    #log t = log gb_scale + gb_rate * v * log q
+    slope, intercept = np.polyfit(sizes, np.log(seconds), 1)
+    costs["gb_rate"] = max(float(slope), 0.0)
+    costs["gb_scale"] = float(math.exp(intercept))
+
+    #startup of a pool worker
+    import multiprocessing
+    start = time.time()
+    with multiprocessing.Pool(1, initializer=groebner_solver._init_chart_worker, initargs=(C, n, m, k, q)) as pool:
+        pool.map(abs, [0])
+    costs["worker_start"] = time.time() - start
+
+
+#Small runs fitting the constants of the model
+GRAPH_CONFIGS = [(2, 2, 2, 7, 1.0), (3, 3, 3, 3, 1.0), (3, 3, 3, 5, 1.0), (3, 3, 3, 5, 0.2),
+                 (3, 3, 3, 4, 1.0), (3, 4, 3, 7, 0.5), (4, 4, 4, 3, 1.0), (3, 3, 3, 9, 0.3)]
+SOLVER_CONFIGS = [(3, 3, 3, 3, 1.0), (3, 3, 3, 5, 0.5), (3, 3, 3, 7, 1.0), (4, 4, 4, 3, 1.0)]
+#(vertices, edges) of the graphs measured for memory
+MEMORY_CONFIGS = [(200000, 0), (100000, 500000), (50000, 1000000), (200000, 1000000)]
+#Below this many bytes per vertex or edge, a memory fit is noise
+MIN_ITEM_BYTES = 8
+
+
+def calibrate(path=COSTS_FILE, quick=False, verbose=False):
+    costs = load_costs(path)
+    random.seed(0)
+    calibrate_graph(GRAPH_CONFIGS[:4] if quick else GRAPH_CONFIGS, costs, verbose)
+    calibrate_memory(MEMORY_CONFIGS[:3] if quick else MEMORY_CONFIGS, costs, verbose)
+    calibrate_solver(SOLVER_CONFIGS[:2] if quick else SOLVER_CONFIGS, costs, verbose)
+    costs = {key: float(value) for key, value in costs.items()}
+    save_costs(costs, path)
+    return costs
+
+
+def argparser():
+    parser = argparse.ArgumentParser(
+        description="Cost model choosing the engines of main.py and groebner_solver.py",
+        epilog="Example usage: sage planner.py calibrate && python3 planner.py plan -n=6 -m=6 -k=6 -q=7"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    cal = sub.add_parser("calibrate", help="Fits the constants of the model on this machine (requires Sage)")
+    cal.add_argument("--costs_file", type=str, default=COSTS_FILE, help="Where the constants are stored")
+    cal.add_argument("--quick", action="store_true", help="Fewer and smaller timed runs")
+    cal.add_argument("--verbose", action="store_true", help="Prints every timed run")
+    pln = sub.add_parser("plan", help="Prints the graph construction plan of main.py")
+    pln.add_argument("-n", type=int, default=4, help="Dimension n for the first vector space")
+    pln.add_argument("-m", type=int, default=4, help="Dimension m for the second vector space")
+    pln.add_argument("-k", type=int, default=4, help="Dimension k for the third vector space")
+    pln.add_argument("-q", type=int, default=5, help="Field size (prime or prime power)")
+    pln.add_argument("--density", type=float, default=1.0, help="Fraction of nonzero entries of the tensor")
+    pln.add_argument("--costs_file", type=str, default=COSTS_FILE, help="Constants of the model")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argparser()
+    if args.command == "calibrate":
+        costs = calibrate(args.costs_file, args.quick, args.verbose)
+        for key, value in sorted(costs.items()):
+            print(f"{key}: {value:.4g}")
+        print(f"Saved to {args.costs_file}")
+    else:
+        nonzero = round(args.density * args.n * args.m * args.k)
+        print_plan(plan_graph(args.n, args.m, args.k, args.q, nonzero, costs=load_costs(args.costs_file)))
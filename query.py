@@ -0,0 +1,180 @@
+import numpy as np
+from collections import OrderedDict, deque
+from finite_field import Fq
+from vectorized import *
+
+"""
+Lazy neighbourhood queries on tensor graphs
+
+Answers local questions (neighbours, degrees, edges, triangles, ego-graphs)
+without building the whole graph: the neighbours of x in P(X) towards P(Z)
+are the projective points of the kernel of the contraction C(x, -, -), which
+is computed only for the points that are asked about and memoized in a
+bounded LRU cache.
+
+Vertex labels follow the vectorized engine of tensor_to_graph: 1..|P(U)|,
+then P(V), then P(W), each in the order of vectorized.projective_points.
+"""
+
+#Number of neighbourhoods kept by a TensorGraphQuery
+QUERY_CACHE = 4096
+
+#Spaces adjacent to each space
+OTHERS = {"U": ("V", "W"), "V": ("U", "W"), "W": ("U", "V")}
+
+
+class TensorGraphQuery:
+    """
+    C: tensor as an int array of shape (n, m, k)
+    field: Fq tables of the field of the entries
+    cache_size: number of neighbourhoods memoized
+
+    Points are given either as vertex labels or as coordinate vectors (any
+    nonzero representative, entries encoded as in finite_field.py or Sage
+    field elements) together with their partition "U", "V" or "W".
+    """
+    def __init__(self, C, field, cache_size=QUERY_CACHE):
+        self.C = np.asarray(C, dtype=np.int64)
+        self.field = field
+        self.cache_size = cache_size
+        self.dims = {X: self.C.shape[a] for X, a in AXES.items()}
+        self.sizes = {X: projective_size(d, field.q) for X, d in self.dims.items()}
+        self.offsets = {"U": 1, "V": 1 + self.sizes["U"], "W": 1 + self.sizes["U"] + self.sizes["V"]}
+        self._neighbours = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_tensor(cls, T, F, cache_size=QUERY_CACHE):
+        #T: 3d-list tensor over the Sage finite field F
+        field = Fq.from_sage(F)
+        return cls(tensor_to_array(T, field), field, cache_size)
+
+    #---- points and labels
+    def partition_of(self, label):
+        for X in ("W", "V", "U"):
+            if label >= self.offsets[X]:
+                if label >= self.offsets[X] + self.sizes[X]:
+                    break
+                return X
+        raise ValueError(f"{label} is not a vertex label (1..{sum(self.sizes.values())})")
+
+    def _resolve(self, point, partition=None):
+        #(space, index in the order of projective_points) of a label or vector
+        if isinstance(point, (int, np.integer)):
+            X = self.partition_of(int(point))
+            if partition is not None and partition != X:
+                raise ValueError(f"label {point} belongs to {X}, not {partition}")
+            return X, int(point) - self.offsets[X]
+        if partition not in OTHERS:
+            raise ValueError("a partition among U, V, W is required for coordinate points")
+        x = np.array([[self.field.to_int(c) for c in point]], dtype=np.int64)
+        if x.shape[1] != self.dims[partition]:
+            raise ValueError(f"points of {partition} have {self.dims[partition]} coordinates")
+        if not x.any():
+            raise ValueError("the zero vector is not a projective point")
+        return partition, int(projective_index(normalize_points(x, self.field), self.field.q)[0])
+
+    def _point(self, X, idx):
+        return projective_points(self.dims[X], self.field.q, idx, idx + 1)
+
+    def label(self, point, partition=None):
+        X, idx = self._resolve(point, partition)
+        return self.offsets[X] + idx
+
+    #Partition and normalized coordinates of a vertex
+    def coordinates(self, point, partition=None):
+        X, idx = self._resolve(point, partition)
+        return X, self._point(X, idx)[0]
+
+    #---- neighbourhoods
+    def _neighbourhood(self, X, idx):
+        #sorted indices of the neighbours of (X, idx) in each adjacent space
+        key = (X, idx)
+        if key in self._neighbours:
+            self.hits += 1
+            self._neighbours.move_to_end(key)
+            return self._neighbours[key]
+        self.misses += 1
+        x = self._point(X, idx)
+        nb = {}
+        for Z in OTHERS[X]:
+            M = neighbour_constraints(self.C, x, X, Z, self.field)
+            found = [projective_index(P, self.field.q) for _, P in iter_kernel_points(M, self.field)]
+            nb[Z] = np.sort(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+        self._neighbours[key] = nb
+        if len(self._neighbours) > self.cache_size:
+            self._neighbours.popitem(last=False)
+        return nb
+
+    def neighbors(self, point, partition=None, towards=None):
+        """
+        returns: sorted labels of the neighbours of point, in both adjacent
+        spaces or only in towards
+        """
+        X, idx = self._resolve(point, partition)
+        nb = self._neighbourhood(X, idx)
+        spaces = OTHERS[X] if towards is None else (towards,)
+        return [int(z) + self.offsets[Z] for Z in spaces for z in nb[Z]]
+
+    def degree(self, point, partition=None):
+        X, idx = self._resolve(point, partition)
+        if (X, idx) in self._neighbours:
+            return sum(len(z) for z in self._neighbourhood(X, idx).values())
+        #kernel dimensions only, the neighbours are not enumerated
+        x = self._point(X, idx)
+        return sum(int(projective_kernel_size(neighbour_constraints(self.C, x, X, Z, self.field), self.field)[0])
+                   for Z in OTHERS[X])
+
+    def is_edge(self, a, b, partition_a=None, partition_b=None):
+        X, i = self._resolve(a, partition_a)
+        Z, j = self._resolve(b, partition_b)
+        if X == Z:
+            return False
+        if (X, i) in self._neighbours:
+            z = self._neighbourhood(X, i)[Z]
+            return bool(np.isin(j, z))
+        #C(x, z, -) = 0
+        M = neighbour_constraints(self.C, self._point(X, i), X, Z, self.field)
+        return not self.field.matmul(M, self._point(Z, j)[:, :, None]).any()
+
+    #Whether u in P(U), v in P(V), w in P(W) are pairwise adjacent
+    def is_triangle(self, u, v, w):
+        return (self.is_edge(u, v, "U", "V") and self.is_edge(u, w, "U", "W")
+                and self.is_edge(v, w, "V", "W"))
+
+    def ego_graph(self, point, partition=None, radius=1, max_vertices=None):
+        """
+        Subgraph induced by the vertices at distance <= radius from point,
+        explored breadth first
+
+        max_vertices: stop adding vertices once this many were reached
+
+        returns: (distance, edges) where distance maps the label of every
+        vertex to its distance from point and edges is the sorted list of
+        (a, b) label pairs with a < b
+        """
+        start = self.label(point, partition)
+        distance = {start: 0}
+        queue = deque([start])
+        while queue:
+            a = queue.popleft()
+            if distance[a] == radius:
+                continue
+            for b in self.neighbors(a):
+                if b not in distance:
+                    if max_vertices is not None and len(distance) >= max_vertices:
+                        queue.clear()
+                        break
+                    distance[b] = distance[a] + 1
+                    queue.append(b)
+        edges = set()
+        for a in distance:
+            for b in self.neighbors(a):
+                if b in distance:
+                    edges.add((min(a, b), max(a, b)))
+        return distance, sorted(edges)
+
+    def cache_info(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._neighbours),
+                "max_size": self.cache_size}
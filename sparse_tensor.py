@@ -0,0 +1,118 @@
+"""
+Sparse 3-tensors
+
+Stores only the nonzero entries of C[i][j][l], both as a coordinate list and
+grouped by each index (compressed fibers), so that edge tests, evaluations
+and isometries skip every zero entry.
+"""
+
+
+class SparseTensor:
+    """
+    entries: list of (i, j, l, c) with c != 0 (COO format)
+    shape: (n, m, k)
+    F: field of the entries
+
+    by_l[l]: list of (i, j, c), used by the UV edge test
+    by_j[j]: list of (i, l, c), used by the UW edge test
+    by_i[i]: list of (j, l, c), used by the VW edge test
+    """
+    def __init__(self, entries, shape, F):
+        self.entries = entries
+        self.shape = shape
+        self.F = F
+        n, m, k = shape
+        self.by_l = [[] for _ in range(k)]
+        self.by_j = [[] for _ in range(m)]
+        self.by_i = [[] for _ in range(n)]
+        for i, j, l, c in entries:
+            self.by_l[l].append((i, j, c))
+            self.by_j[j].append((i, l, c))
+            self.by_i[i].append((j, l, c))
+
+    def density(self):
+        n, m, k = self.shape
+        return len(self.entries) / (n * m * k)
+
+    def to_dense(self):
+        n, m, k = self.shape
+        T = [[[self.F(0) for _ in range(k)] for _ in range(m)] for _ in range(n)]
+        for i, j, l, c in self.entries:
+            T[i][j][l] = c
+        return T
+
+
+#Converts a 3d-list tensor into a SparseTensor
+def to_sparse(T):
+    entries = [(i, j, l, c)
+               for i, M in enumerate(T)
+               for j, row in enumerate(M)
+               for l, c in enumerate(row) if c != 0]
+    return SparseTensor(entries, (len(T), len(T[0]), len(T[0][0])), T[0][0][0].parent())
+
+
+#Fraction of nonzero entries of a 3d-list tensor or SparseTensor
+def density(T):
+    if isinstance(T, SparseTensor):
+        return T.density()
+    nonzero = sum(1 for M in T for row in M for c in row if c != 0)
+    return nonzero / (len(T) * len(T[0]) * len(T[0][0]))
+
+
+#Reads a tensor in the 3d-list file format directly into a SparseTensor
+def parse_sparse_tensor_from_file(filename, q):
+    from tensor import parse_tensor_from_file
+    return to_sparse(parse_tensor_from_file(filename, q))
+
+
+#Sparse counterparts of the functions of tensor.py
+def tensor_value_sparse(S, u, v, w):
+    s = S.F(0)
+    for i, j, l, c in S.entries:
+        s += u[i] * v[j] * w[l] * c
+    return s
+
+def is_edge_UV_sparse(S, u, v):
+    for fiber in S.by_l:
+        s = S.F(0)
+        for i, j, c in fiber:
+            s += u[i] * v[j] * c
+        if s != 0:
+            return False
+    return True
+
+def is_edge_UW_sparse(S, u, w):
+    for fiber in S.by_j:
+        s = S.F(0)
+        for i, l, c in fiber:
+            s += u[i] * w[l] * c
+        if s != 0:
+            return False
+    return True
+
+def is_edge_VW_sparse(S, v, w):
+    for fiber in S.by_i:
+        s = S.F(0)
+        for j, l, c in fiber:
+            s += v[j] * w[l] * c
+        if s != 0:
+            return False
+    return True
+
+def apply_isometry_sparse(S, A, B, C):
+    #T'_{p,q,r} = sum over nonzero T_{i,j,k} of T_{i,j,k} * A[i,p] * B[j,q] * C[k,r]
+    #returns a 3d-list, as apply_isometry
+    n, m, k = S.shape
+    T_prime = [[[S.F(0) for r in range(k)] for q in range(m)] for p in range(n)]
+    for i, j, l, c in S.entries:
+        for p in range(n):
+            a = c * A[i, p]
+            if a == 0:
+                continue
+            for q in range(m):
+                b = a * B[j, q]
+                if b == 0:
+                    continue
+                for r in range(k):
+                    T_prime[p][q][r] += b * C[l, r]
+    return T_prime
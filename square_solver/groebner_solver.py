@@ -1,6 +1,44 @@
+import os
+import sys
 import argparse
 from sage.all import *
 import random
+import itertools
+import multiprocessing
+#planner.py and sparse_tensor.py live in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from planner import plan_solver, print_plan
+from sparse_tensor import SparseTensor, to_sparse
+#---------------------------
+# Sparse tensors
+#---------------------------
+def equation_form(C, n, m, k, engine="dense"):
+    """
+    Form of C the edge equations are built from:
+    "sparse" (nonzero entries only) or "dense" (every entry).
+    "auto" is resolved beforehand by planner.plan_solver (see example_all_types).
+    """
+    if engine == "sparse":
+        return C if isinstance(C, SparseTensor) else to_sparse(C)
+    if engine == "dense":
+        return C
+    raise ValueError(f"Unknown equation form {engine}, expected dense or sparse")
+
+def sparse_edge(fibers, x, y, R):
+    """
+    One polynomial per fiber of a SparseTensor (by_l, by_j or by_i), sum of
+    c * x[a] * y[b] over its nonzero entries.
+    Zero polynomials are dropped since they do not change the ideal.
+    """
+    eqs = []
+    for fiber in fibers:
+        poly = R(0)
+        for a, b, c in fiber:
+            poly += c * x[a] * y[b]
+        if poly != 0:
+            eqs.append(poly)
+    return eqs
+
 #---------------------------
 # Edge condition (polynomial) helper functions
 #---------------------------
@@ -9,6 +47,8 @@ def edge_UV(C, u, v, n, m, k, R):
     For l < k, computes the polynomials P_l(u,v) = sum_{i=0}^{n-1} sum_{j=0}^{m-1} C[i][j][l] * u[i] * v[j]
     u,v is an edge iff for all l < k, P_l(u,v) = 0
     """
+    if isinstance(C, SparseTensor):
+        return sparse_edge(C.by_l, u, v, R)
     eqs = []
     for l in range(k):
         poly = R(0)
@@ -23,6 +63,8 @@ def edge_UW(C, u, w, n, m, k, R):
     For each j in 0,...,m-1 computes P_j(u,w) = sum_{i=0}^{n-1} sum_{l=0}^{k-1} C[i][j][l] * u[i] * w[l]
     u,w is an edge if P_j(u,w) = 0 for all j
     """
+    if isinstance(C, SparseTensor):
+        return sparse_edge(C.by_j, u, w, R)
     eqs = []
     for j in range(m):
         poly = R(0)
@@ -37,6 +79,8 @@ def edge_VW(C, v, w, n, m, k, R):
     For each i in 0,...,n-1 computes P_i(v,w) = sum_{j=0}^{m-1} sum_{l=0}^{k-1} C[i][j][l] * v[j] * w[l]
     v,w is an edge if for all i P_i(v,w) = 0
     """
+    if isinstance(C, SparseTensor):
+        return sparse_edge(C.by_i, v, w, R)
     eqs = []
     for i in range(n):
         poly = R(0)
@@ -48,223 +92,296 @@ def edge_VW(C, v, w, n, m, k, R):
 
 
 #---------------------------
-# Cycle type functions
+# 3. Master function to run all types
+#---------------------------
+def find_all_4cycles(C, n, m, k, q, engine="dense"):
+    """
+    Solves the six types with the normalizations of DEFAULT_PREFIXES.
+    Types are solved in DEFAULT_ORDER so that the wedge bases of D and E are
+    cached before A, B and C extend them (see 3c).
+    """
+    C = equation_form(C, n, m, k, engine)
+    cache = {}
+    sols = {}
+    for type_ in DEFAULT_ORDER:
+        if verbose:
+            print(f"Computing type {type_}")
+        sols["Type " + type_] = [walk for _, walk in solve_walk(C, n, m, k, q, type_, DEFAULT_PREFIXES[type_],
+                                                                cache, split=DEFAULT_SPLITS[type_])]
+        if verbose:
+            print(f"{len(sols['Type ' + type_])} walks of type {type_} found ({len(cache)} wedge bases cached)")
+    return {"Type " + type_: sols["Type " + type_] for type_ in WALKS}
+
+#---------------------------
+# 3b. Full projective chart coverage
 #---------------------------
+# Each type as its closed walk (vertex, space); consecutive vertices are adjacent
+WALKS = {
+    "A": [("u", "U"), ("v", "V"), ("u'", "U"), ("v'", "V")],
+    "B": [("u", "U"), ("w", "W"), ("u'", "U"), ("w'", "W")],
+    "C": [("v", "V"), ("w", "W"), ("v'", "V"), ("w'", "W")],
+    "D": [("u", "U"), ("v", "V"), ("u'", "U"), ("w", "W")],
+    "E": [("u", "U"), ("v", "V"), ("w", "W"), ("v'", "V")],
+    "F": [("u", "U"), ("w", "W"), ("v", "V"), ("w'", "W")],
+}
 
-def typeA_closed_walks(C, n, m, k, q):
+EDGES = {("U", "V"): edge_UV, ("U", "W"): edge_UW, ("V", "W"): edge_VW}
+
+def edge_eqs(C, X, x, Y, y, n, m, k, R):
+    """
+    Edge equations between x in P(X) and y in P(Y), in either order of spaces
     """
-    Type A: vertices: u, u' in U; v, v' in V.
+    if (X, Y) in EDGES:
+        return EDGES[(X, Y)](C, x, y, n, m, k, R)
+    return EDGES[(Y, X)](C, y, x, n, m, k, R)
+
+def same_space_pairs(walk):
+    return [(a, b) for a in range(4) for b in range(a+1, 4) if walk[a][1] == walk[b][1]]
 
-    we enforce u_0 = u'_1 = 1 and u_1 = u'_0 = 0
-    and v_0 = v'_1 = 1 and v_1 = v'_0 = 0 to ensure ideal of degree 0
+def chart_size(type_, pivots, n, m, k):
     """
-    var_names = (['x{}'.format(i) for i in range(3, n+1)] +
-                 ['y{}'.format(i) for i in range(3, n+1)] +
-                 ['z{}'.format(j) for j in range(3, m+1)] +
-                 ['w{}'.format(j) for j in range(3, m+1)])
-    R = PolynomialRing(GF(q), var_names, order='degrevlex')
-    gens = R.gens()
-    u      = [R(1), R(0)] + list(gens[0:(n-2)])                   # u in P(U)
-    uprime = [R(0), R(1)] + list(gens[(n-2):(2*(n-2))])            # u' in P(U)
-    v      = [R(1),R(0)] + list(gens[(2*(n-2)):(2*(n-2)+(m-2))])   # v in P(V)
-    vprime = [R(0), R(1)] + list(gens[(2*(n-2)+(m-2)):(2*(n-2)+2*(m-2))])  # v' in P(V)
-    
-    eqs = []
-    eqs += edge_UV(C, u, v, n, m, k, R)            # edge u -> v
-    eqs += edge_UV(C, uprime, v, n, m, k, R)         # edge v -> u'
-    eqs += edge_UV(C, uprime, vprime, n, m, k, R)     # edge u' -> v'
-    eqs += edge_UV(C, u, vprime, n, m, k, R)         # edge v' -> u
-    
-    I = R.ideal(eqs)
-    I.groebner_basis()
-    if verbose:
-        print("Computing variety")
-    sols = I.variety()
-    return sols
-
-# Type B: vertices: u, u' in U; w, w' in W
-def typeB_closed_walks(C, n, m, k, q):
-    """
-    Type B: vertices: u, u' in U; w, w' in W
-
-    we enforce u_0 = u'_1 = 1 and u_1 = u'_0 = 0
-    and w_0 = w'_1 = 1 and w_1 = w'_0 = 0 to ensure ideal of degree 0
-    """
-    var_names = (['x{}'.format(i) for i in range(3, n+1)] +
-                 ['y{}'.format(i) for i in range(3, n+1)] +
-                 ['z{}'.format(l) for l in range(3, k+1)] +
-                 ['w{}'.format(l) for l in range(3, k+1)])
-    R = PolynomialRing(GF(q), var_names, order='degrevlex')
-    gens = R.gens()
-    u      = [R(1), R(0)] + list(gens[0:(n-2)])                   # u in P(U)
-    uprime = [R(0), R(1)] + list(gens[(n-2):(2*(n-2))])            # u' in P(U)
-    w      = [R(1), R(0)] + list(gens[(2*(n-2)):(2*(n-2)+(k-2))])   # w in P(W)
-    wprime = [R(0), R(1)] + list(gens[(2*(n-2)+(k-2)):(2*(n-2)+2*(k-2))])  # w' in P(W)
-    
-    eqs = []
-    eqs += edge_UW(C, u, w, n, m, k, R)            # edge u -> w
-    eqs += edge_UW(C, uprime, w, n, m, k, R)         # edge w -> u'
-    eqs += edge_UW(C, uprime, wprime, n, m, k, R)     # edge u' -> w'
-    eqs += edge_UW(C, u, wprime, n, m, k, R)         # edge w' -> u
+    Number of free coordinates of a chart
+    """
+    dims = {"U": n, "V": m, "W": k}
+    return sum(dims[X] - 1 - p for (_, X), p in zip(WALKS[type_], pivots))
 
-    
-    I = R.ideal(eqs)
-    if verbose:
-        print("Solving variety")
-    sols = I.variety()
-    return sols
-
-# Type C: vertices: v, v' in V; w, w' in W
-def typeC_closed_walks(C, n, m, k, q):
-    """
-    Type C: vertices: v, v' in V; w, w' in W.
-
-    we enforce v_0 = v'_1 = 1 and v_1 = v'_0 = 0
-    and w_0 = w'_1 = 1 and w_1 = w'_0 = 0 to ensure ideal of degree 0
-    """
-    var_names = (['x{}'.format(j) for j in range(3, m+1)] +
-                 ['y{}'.format(j) for j in range(3, m+1)] +
-                 ['z{}'.format(l) for l in range(3, k+1)] +
-                 ['w{}'.format(l) for l in range(3, k+1)])
-    R = PolynomialRing(GF(q), var_names, order='degrevlex')
-    gens = R.gens()
-    v      = [R(1), R(0)] + list(gens[0:(m-2)])                   # v in P(V)
-    vprime = [R(0), R(1)] + list(gens[(m-2):(2*(m-2))])            # v' in P(V)
-    w      = [R(1), R(0)] + list(gens[(2*(m-2)):(2*(m-2)+(k-2))])   # w in P(W)
-    wprime = [R(0), R(1)] + list(gens[(2*(m-2)+(k-2)):(2*(m-2)+2*(k-2))])  # w' in P(W)
-    
-    eqs = []
-    eqs += edge_VW(C, v, w, n, m, k, R)            # edge v -> w
-    eqs += edge_VW(C, vprime, w, n, m, k, R)         # edge w -> v'
-    eqs += edge_VW(C, vprime, wprime, n, m, k, R)     # edge v' -> w'
-    eqs += edge_VW(C, v, wprime, n, m, k, R)         # edge w' -> v
+def walk_charts(type_, n, m, k):
+    """
+    Charts covering every walk of the given type. A chart fixes for each vertex
+    the position p of its first nonzero coordinate: x = (0,...,0,1,*,...,*).
+    These charts are disjoint and cover P(U), P(V) and P(W).
 
-    I = R.ideal(eqs)
-    if verbose:
-        print("Solving variety")
-    sols = I.variety()
-    return sols
-
-# Type D: vertices: u, u' in U; v in V; w in W
-def typeD_closed_walks(C, n, m, k, q):
-    """
-    Type D: vertices: u, u' in U; v in V; w in W
-
-    we enforce the first coordinate of v and w to be 1
-    and u_0 != u'_0 
-    """
-    var_names = (['x{}'.format(i) for i in range(3, n+1)] +
-                 ['y{}'.format(i) for i in range(3, n+1)] +
-                 ['z{}'.format(j) for j in range(2, m+1)] +
-                 ['w{}'.format(l) for l in range(2, k+1)])
-    R = PolynomialRing(GF(q), var_names, order='degrevlex')
-    gens = R.gens()
-    u      = [R(1), R(0)] + list(gens[0:(n-2)])
-    uprime = [R(0), R(1)] + list(gens[(n-2):(2*(n-2))])
-    v      = [R(1)] + list(gens[(2*(n-2)):(2*(n-2)+(m-1))])
-    w      = [R(1)] + list(gens[(2*(n-2)+(m-1)):(2*(n-2)+(m-1)+(k-1))])
-    
-    eqs = []
-    eqs += edge_UV(C, u, v, n, m, k, R)            # edge u -> v
-    eqs += edge_UV(C, uprime, v, n, m, k, R)         # edge v -> u'
-    eqs += edge_UW(C, uprime, w, n, m, k, R)         # edge u' -> w
-    eqs += edge_UW(C, u, w, n, m, k, R)              # edge w -> u
-    
-    I = R.ideal(eqs)
-    if verbose:
-        print("Solving variety")
-    sols = I.variety()
-    return sols
-
-# Type E: vertices: u in U; v, v' in V; w in W
-def typeE_closed_walks(C, n, m, k, q):
-    """
-    Type E: vertices: u in U; v, v' in V; w in W.
-
-    we enforce the first coordinate of u and w to be 1
-    and v_0 != v'_0 
-    """
-    var_names = (['x{}'.format(i) for i in range(2, n+1)] +
-                 ['z{}'.format(j) for j in range(3, m+1)] +
-                 ['w{}'.format(j) for j in range(3, m+1)] +
-                 ['y{}'.format(l) for l in range(2, k+1)])
-    R = PolynomialRing(GF(q), var_names, order='degrevlex')
-    gens = R.gens()
-    u      = [R(1)] + list(gens[0:(n-1)])
-    v      = [R(1), R(0)] + list(gens[(n-1):(n-1)+(m-2)])
-    vprime = [R(0), R(1)] + list(gens[(n-1)+(m-2):(n-1)+2*(m-2)])
-    w      = [R(1)] + list(gens[(n-1)+2*(m-2):(n-1)+2*(m-2)+(k-1)])
-    
-    eqs = []
-    eqs += edge_UV(C, u, v, n, m, k, R)            # u -> v
-    eqs += edge_VW(C, v, w, n, m, k, R)            # v -> w
-    eqs += edge_VW(C, vprime, w, n, m, k, R)         # w -> v'
-    eqs += edge_UV(C, u, vprime, n, m, k, R)         # v' -> u
-    
-    I = R.ideal(eqs)
-    if verbose:
-        print("Solving variety")
-    sols = I.variety()
-    return sols
-
-# Type F: vertices: u in U; v in V; w, w' in W
-def typeF_closed_walks(C, n, m, k, q):
-    """
-    Type F: vertices: u in U; v in V; w, w' in W.
-
-    we enforce the first coordinate of u and v to be 1
-    and w_0 != w'_0 
-    """
-    var_names = (['x{}'.format(i) for i in range(2, n+1)] +
-                 ['z{}'.format(j) for j in range(2, m+1)] +
-                 ['y{}'.format(l) for l in range(3, k+1)] +
-                 ['w{}'.format(l) for l in range(3, k+1)])
-    R = PolynomialRing(GF(q), var_names, order='degrevlex')
-    gens = R.gens()
-    u      = [R(1)] + list(gens[0:(n-1)])
-    v      = [R(1)] + list(gens[(n-1):(n-1)+(m-1)])
-    w      = [R(1), R(0)] + list(gens[(n-1)+(m-1):(n-1)+(m-1)+(k-2)])
-    wprime = [R(0), R(1)] + list(gens[(n-1)+(m-1)+(k-2):(n-1)+(m-1)+2*(k-2)])
-    
-    eqs = []
-    eqs += edge_UW(C, u, w, n, m, k, R)            # u -> w
-    eqs += edge_VW(C, v, w, n, m, k, R)            # w -> v
-    eqs += edge_VW(C, v, wprime, n, m, k, R)         # v -> w'
-    eqs += edge_UW(C, u, wprime, n, m, k, R)         # w' -> u
-    
-    I = R.ideal(eqs)
-    if verbose:
-        print("Solving variety")
-    sols = I.variety()
-    return sols
+    Swapping the two vertices of a same-space pair gives the same cycle, so only
+    charts with p(first) <= p(second) are kept. Charts with the most free
+    coordinates (i.e. the most points) come first.
+    """
+    dims = {"U": n, "V": m, "W": k}
+    walk = WALKS[type_]
+    pairs = same_space_pairs(walk)
+    charts = []
+    for pivots in itertools.product(*[range(dims[X]) for _, X in walk]):
+        if all(pivots[a] <= pivots[b] for a, b in pairs):
+            charts.append(pivots)
+    charts.sort(key=lambda pivots: chart_size(type_, pivots, n, m, k), reverse=True)
+    return charts
 
 #---------------------------
-# 3. Master function to run all types
+# 3c. Shared Groebner bases of walk sub-systems
 #---------------------------
-def find_all_4cycles(C, n, m, k, q):
-    sols = [0] * 6
-    functions = [("A",typeA_closed_walks), \
-                 ("B", typeB_closed_walks), \
-                 ("C", typeC_closed_walks), \
-                 ("D", typeD_closed_walks), \
-                 ("E", typeE_closed_walks), \
-                 ("F", typeF_closed_walks)]
-    
-    for idx, (type_, func) in enumerate(functions):
-        if verbose:
-            print(f"Computing type {type_}")
-        sols[idx] = func(C,n,m,k,q)
-        if verbose:
-            print(f"{len(sols[idx])} walks of type {type_} found")
-    
-    return {"Type A": sols[0], "Type B": sols[1], "Type C": sols[2],
-            "Type D": sols[3], "Type E": sols[4], "Type F": sols[5]}
+# Every walk x0 -> x1 -> x2 -> x3 -> x0 is the union of the two wedges
+# x0 -> x1 -> x2 and x2 -> x3 -> x0 (split 0), or of x1 -> x2 -> x3 and
+# x3 -> x0 -> x1 (split 1), paths through a middle vertex. Groebner bases of
+# wedges are computed once in a ring holding every vertex of every type and
+# each walk only extends two cached bases.
+# In --charts mode, the same wedge recurs between types (e.g. u -> v -> u'
+# in types A and D) and between charts. With the default normalizations, a
+# wedge whose middle vertex fixes more leading zeros is the cached wedge
+# plus linear equations: u -> v -> u' of type A (v = (1,0,*)) is the one of
+# type D (v = (1,*)) with v_2 = 0. Hence D and E (split 1) are solved first
+# and A, B, C extend one of their wedges each:
+#   A: u -> v -> u'   from D: u -> v -> u'
+#   B: u -> w -> u'   from D: u' -> w -> u
+#   C: v -> w -> v'   from E: v -> w -> v'
+#   F (split 1): w -> v -> w', w' -> u -> w
+
+# Variable names of each vertex in the shared ring
+SLOTS = {"u": "x", "u'": "y", "v": "z", "v'": "t", "w": "w", "w'": "s"}
+
+# Default normalizations, as the fixed leading coordinates of each vertex of
+# WALKS[type]: in types A, B, C the two vertices of each space are (1,0,*)
+# and (0,1,*); in types D, E, F the pair is (1,0,*), (0,1,*) and the other
+# two vertices are (1,*)
+DEFAULT_PREFIXES = {
+    "A": [(1, 0), (1, 0), (0, 1), (0, 1)],
+    "B": [(1, 0), (1, 0), (0, 1), (0, 1)],
+    "C": [(1, 0), (1, 0), (0, 1), (0, 1)],
+    "D": [(1, 0), (1,), (0, 1), (1,)],
+    "E": [(1,), (1, 0), (1,), (0, 1)],
+    "F": [(1,), (1, 0), (1,), (0, 1)],
+}
+
+# Wedge split and order of the types in find_all_4cycles, see above
+DEFAULT_SPLITS = {"A": 0, "B": 0, "C": 0, "D": 0, "E": 1, "F": 1}
+DEFAULT_ORDER = ["D", "E", "A", "B", "C", "F"]
+
+def shared_ring(n, m, k, q):
+    """
+    returns: (R, layout) where R has one variable per coordinate of every
+    vertex in SLOTS and layout maps a vertex to the indices of its variables
+    """
+    dims = {"U": n, "V": m, "W": k}
+    space = {"u": "U", "u'": "U", "v": "V", "v'": "V", "w": "W", "w'": "W"}
+    var_names = []
+    layout = {}
+    for slot, name in SLOTS.items():
+        layout[slot] = (len(var_names), dims[space[slot]])
+        var_names += ['{}{}'.format(name, j) for j in range(1, dims[space[slot]]+1)]
+    return PolynomialRing(GF(q, 'a'), var_names, order='degrevlex'), layout
+
+def slot_point(R, layout, slot, prefix):
+    """
+    Point of the vertex slot whose leading coordinates are fixed to prefix
+    """
+    start, dim = layout[slot]
+    gens = R.gens()[start:start+dim]
+    return [R(c) for c in prefix] + list(gens[len(prefix):])
+
+def pivot_prefix(p):
+    return (0,) * p + (1,)
+
+def extends(key, parent):
+    """
+    Whether the wedge key is the wedge parent with more leading coordinates
+    of the middle vertex fixed to 0
+    """
+    (ends, mid, field_eqs), (p_ends, p_mid, p_field_eqs) = key, parent
+    return (ends == p_ends and field_eqs == p_field_eqs and mid[:2] == p_mid[:2]
+            and len(p_mid[2]) < len(mid[2]) and mid[2][:len(p_mid[2])] == p_mid[2]
+            and not any(mid[2][len(p_mid[2]):]))
+
+def wedge_basis(C, n, m, k, q, R, layout, ends, mid, cache, field_eqs):
+    """
+    Groebner basis of the wedge ends[0] -> mid -> ends[1], computed once
+
+    ends, mid: (slot, space, prefix) of the vertices
+    field_eqs: adds x^q - x for the free variables of the wedge
+
+    When a cached wedge only differs by fixing fewer zeros of mid, its basis
+    is extended with these variables instead of starting from scratch.
+    """
+    key = (tuple(sorted(ends)), mid, field_eqs)
+    parents = [p for p in cache if extends(key, p)]
+    if key not in cache and parents:
+        parent = max(parents, key=lambda p: len(p[1][2]))
+        start, _ = layout[mid[0]]
+        zeros = list(R.gens()[start+len(parent[1][2]):start+len(mid[2])])
+        cache[key] = list(R.ideal(cache[parent] + zeros).groebner_basis())
+    if key not in cache:
+        mid_pt = slot_point(R, layout, mid[0], mid[2])
+        eqs = []
+        free = set()
+        for slot, X, prefix in ends:
+            pt = slot_point(R, layout, slot, prefix)
+            eqs += edge_eqs(C, X, pt, mid[1], mid_pt, n, m, k, R)
+            free.update(pt[len(prefix):])
+        free.update(mid_pt[len(mid[2]):])
+        if field_eqs:
+            eqs += [x**q - x for x in free]
+        cache[key] = list(R.ideal(eqs).groebner_basis())
+    return cache[key]
+
+def solve_walk(C, n, m, k, q, type_, prefixes, cache, field_eqs=False, split=0):
+    """
+    Walks of the given type whose vertices have the given fixed leading
+    coordinates, computed from the two cached wedge bases of the split
+
+    returns: list of (key, walk) where walk is the tuple of the four points and
+    key identifies the underlying 4-cycle (its set of points in each space)
+    """
+    F = GF(q, 'a')
+    R, layout = shared_ring(n, m, k, q)
+    walk = WALKS[type_]
+    specs = [(slot, X, tuple(prefix)) for (slot, X), prefix in zip(walk, prefixes)]
+    points = [slot_point(R, layout, slot, prefix) for slot, _, prefix in specs]
+
+    x0, x1, x2, x3 = [(split + i) % 4 for i in range(4)]
+    gb = (wedge_basis(C, n, m, k, q, R, layout, (specs[x0], specs[x2]), specs[x1], cache, field_eqs) +
+          wedge_basis(C, n, m, k, q, R, layout, (specs[x2], specs[x0]), specs[x3], cache, field_eqs))
+    #variables of vertices absent from this type or fixed by the normalization
+    free = set(x for pt, spec in zip(points, specs) for x in pt[len(spec[2]):])
+    zeros = [x for x in R.gens() if x not in free]
+    sols = R.ideal(gb + zeros).variety()
+
+    walks = []
+    for sol in sols:
+        vals = [sol[x] for x in R.gens()]
+        pts = [tuple(F(c(*vals)) for c in pt) for pt in points]
+        #u = u' (resp. v = v', w = w') is not a 4-cycle
+        if any(pts[a] == pts[b] for a, b in same_space_pairs(walk)):
+            continue
+        key = tuple(frozenset(pt for pt, (_, X) in zip(pts, walk) if X == Y) for Y in "UVW")
+        walks.append((key, tuple(pts)))
+    return walks
+
+def chart_closed_walks(C, n, m, k, q, type_, pivots, cache):
+    """
+    Solves the walk equations of one chart.
+    Field equations x^q - x make the ideal zero-dimensional whatever the chart.
+    """
+    return solve_walk(C, n, m, k, q, type_, [pivot_prefix(p) for p in pivots], cache, field_eqs=True)
+
+def first_wedge(type_, pivots):
+    """
+    Identifies the wedge x0 -> x1 -> x2 of a chart, used to group charts
+    sharing it on the same worker
+    """
+    walk = WALKS[type_]
+    ends = sorted([(walk[0][0], pivots[0]), (walk[2][0], pivots[2])])
+    return (tuple(ends), (walk[1][0], pivots[1]))
+
+#State of the chart workers, set once by the pool initializer
+_chart_args = None
+_wedge_cache = {}
+
+def _init_chart_worker(C, n, m, k, q):
+    global _chart_args
+    _chart_args = (C, n, m, k, q)
+
+def _solve_charts(group):
+    return [(type_, chart_closed_walks(*_chart_args, type_, pivots, _wedge_cache)) for type_, pivots in group]
+
+def chart_groups(n, m, k):
+    """
+    Charts of every type grouped by first wedge, biggest charts first
+    """
+    groups = {}
+    for type_ in WALKS:
+        for pivots in walk_charts(type_, n, m, k):
+            groups.setdefault(first_wedge(type_, pivots), []).append((type_, pivots))
+    #interleave types, biggest charts first, so that existence queries end early
+    return sorted(groups.values(), key=lambda g: max(chart_size(t, p, n, m, k) for t, p in g), reverse=True)
+
+def find_all_4cycles_charts(C, n, m, k, q, workers=None, exists=False, engine="dense", chunksize=1):
+    """
+    Exact count of the 4-cycles of each type over all projective charts,
+    solved concurrently in a process pool and deduplicated.
+
+    Charts sharing their first wedge are sent together to one worker, which
+    keeps the wedge bases it computed for its next charts.
+
+    workers: size of the process pool (default: number of cores)
+    exists: stop as soon as one chart contains a 4-cycle
+    chunksize: groups handed to a worker at once
+    """
+    C = equation_form(C, n, m, k, engine)
+    tasks = chart_groups(n, m, k)
+    total = sum(len(g) for g in tasks)
+    if verbose:
+        print(f"Solving {total} charts in {len(tasks)} groups sharing a wedge")
+
+    found = {type_: {} for type_ in WALKS}
+    done = 0
+    with multiprocessing.Pool(workers, initializer=_init_chart_worker, initargs=(C, n, m, k, q)) as pool:
+        for results in pool.imap_unordered(_solve_charts, tasks, chunksize):
+            nonempty = False
+            for type_, walks in results:
+                done += 1
+                nonempty = nonempty or len(walks) > 0
+                for key, walk in walks:
+                    found[type_].setdefault(key, walk)
+            if verbose:
+                print(f"{done}/{total} charts solved")
+            if exists and nonempty:
+                #leaving the with block terminates the remaining charts
+                break
+
+    return {"Type " + type_: list(cycles.values()) for type_, cycles in found.items()}
 
 #---------------------------
 # 4. Usage
 #---------------------------
-def example_all_types(q,n,m,k):
-    GFq = GF(q)
+def example_all_types(q,n,m,k,charts=False,workers=None,exists=False,engine="auto"):
+    GFq = GF(q, 'a')
     
     random.seed(0)
     C = [[[GFq.random_element() for _ in range(k)]
@@ -277,7 +394,39 @@ def example_all_types(q,n,m,k):
             for j in range(m):
                 print(C[i][j])
     
-    solutions = find_all_4cycles(C, n, m, k, q)
+    #equation form and parallelism from the cost model of planner.py
+    chunksize = 1
+    if engine == "auto":
+        nonzero = sum(1 for M in C for row in M for c in row if c != 0)
+        if charts or exists:
+            tasks = chart_groups(n, m, k)
+            systems = [chart_size(t, p, n, m, k) for g in tasks for t, p in g]
+        else:
+            tasks = [None]
+            dims = {"U": n, "V": m, "W": k}
+            systems = [sum(dims[X] - len(prefix) for (_, X), prefix in zip(WALKS[t], DEFAULT_PREFIXES[t])) for t in WALKS]
+        plan = plan_solver(n, m, k, q, nonzero, systems, len(tasks), exists)
+        if verbose:
+            print_plan(plan)
+        engine = plan["engine"]
+        chunksize = plan["chunksize"]
+        if workers is None:
+            workers = plan["workers"]
+
+    if charts or exists:
+        solutions = find_all_4cycles_charts(C, n, m, k, q, workers, exists, engine, chunksize)
+    else:
+        solutions = find_all_4cycles(C, n, m, k, q, engine)
+
+    if exists:
+        found = [(typ, sol[0]) for typ, sol in solutions.items() if sol]
+        if csv:
+            print(1 if found else 0)
+        elif found:
+            print(f"4-cycle found, {found[0][0]}: {found[0][1]}")
+        else:
+            print("No 4-cycle")
+        return
     
     if verbose:
         print("Enlisting all solutions")
@@ -295,7 +444,7 @@ def example_all_types(q,n,m,k):
     else:
         print()
 
-def argparser():
+def argparser(argv=None):
     #Parses the values of (n,m,k,q,labeled) as described
     parser = argparse.ArgumentParser(
         description="Finds constrained 4-cycles of random tensor graph",
@@ -304,11 +453,15 @@ def argparser():
     parser.add_argument("-n", type=int, default=5, help="Dimension n for the first vector space")
     parser.add_argument("-m", type=int, default=5, help="Dimension m for the second vector space")
     parser.add_argument("-k", type=int, default=5, help="Dimension k for the third vector space")
-    parser.add_argument("-q", type=int, default=13, help="Prime field size")
+    parser.add_argument("-q", type=int, default=13, help="Field size (prime or prime power)")
     parser.add_argument("--same_dim", action="store_true", help="Coerces each dimension to be equal to n (i.e. n = m = k)")
     parser.add_argument("--minimal", action="store_true", help="Only displays random tensor and solutions (if any)")
     parser.add_argument("--csv", action="store_true", help="Outputs results in csv format")
-    return parser.parse_args()
+    parser.add_argument("--charts", action="store_true", help="Covers every projective chart and counts distinct 4-cycles exactly")
+    parser.add_argument("--workers", type=int, default=None, help="Processes used to solve charts in parallel (default: all cores)")
+    parser.add_argument("--exists", action="store_true", help="Only tells whether any 4-cycle exists, stopping at the first chart containing one")
+    parser.add_argument("--engine", type=str, default="auto", choices=["auto", "dense", "sparse"], help="Builds edge equations from every entry or from the nonzero ones; auto also sets --workers with the cost model of planner.py")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
     global verbose 
@@ -332,4 +485,4 @@ if __name__ == "__main__":
         print(f"{n},{m},{k},{q},",end="")
         verbose = False
     # Run the example
-    example_all_types(q,n,m,k)
\ No newline at end of file
+    example_all_types(q,n,m,k,charts=args.charts,workers=args.workers,exists=args.exists,engine=args.engine)
\ No newline at end of file
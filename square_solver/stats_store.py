@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import glob
+import time
+import hashlib
+import argparse
+import numpy as np
+
+"""
+    Columnar store for the output of groebner_tester.sh
+
+    Each sweep produces two row-aligned text files:
+        time_stats_qX_nY.csv      i, n, m, k, q, seconds, rss_kb
+        output_groebner_qX_nY.csv n, m, k, q, A, B, C, D, E, F,
+    They are merged into one typed NumPy array per column (<store>/<column>.npy),
+    sorted by the key (n, m, k, q, sweep, sample). groebner_tester.sh appends
+    every sweep to the same files and restarts the sample index at 1, so a
+    file is split into sweeps where the index stops increasing and each sweep
+    is identified by a hash of its rows: re-ingesting a file replaces the
+    rows of the sweeps already stored and adds the new ones. Queries memory-map the columns and
+    aggregate them in a single streaming pass, without re-parsing any text.
+"""
+
+TYPES = ["A", "B", "C", "D", "E", "F"]
+
+#Column name -> storage type. The first six columns form the key.
+COLUMNS = {
+    "n": np.uint8,
+    "m": np.uint8,
+    "k": np.uint8,
+    "q": np.uint16,
+    "sweep": np.uint64,
+    "sample": np.uint32,
+    "seconds": np.float32,
+    "rss_kb": np.uint32,
+}
+COLUMNS.update({f"type{t}": np.uint32 for t in TYPES})
+KEY = ["n", "m", "k", "q", "sweep", "sample"]
+
+#Rows processed at a time by queries
+CHUNK = 1 << 16
+
+#Log-spaced bins used for streaming quantiles (~1% relative resolution)
+SECONDS_BINS = np.logspace(-3, 6, 2000)
+RSS_BINS = np.logspace(2, 10, 2000)
+
+
+#---------------------------
+# Ingestion
+#---------------------------
+#Identifiers of the sweeps of row-aligned time/count arrays
+def sweep_ids(times, counts):
+    """
+    returns: uint64 array with, for each row, 64 bits of the hash of the rows
+    of its sweep (a new sweep starts wherever the sample index does not increase)
+    """
+    starts = np.concatenate([[0], np.nonzero(np.diff(times[:, 0]) <= 0)[0] + 1, [len(times)]])
+    ids = np.zeros(len(times), dtype=np.uint64)
+    for a, b in zip(starts[:-1], starts[1:]):
+        h = hashlib.sha256(np.ascontiguousarray(times[a:b]).tobytes())
+        h.update(np.ascontiguousarray(counts[a:b]).tobytes())
+        ids[a:b] = int.from_bytes(h.digest()[:8], "little")
+    return ids
+
+
+def read_sweep(time_file, output_file):
+    """
+    Parses a pair of row-aligned sweep files
+
+    returns: dictionary column -> array (unsorted)
+    """
+    times = np.loadtxt(time_file, delimiter=",", ndmin=2)
+    #the trailing comma of output_groebner rows leaves an empty 11th field
+    counts = np.loadtxt(output_file, delimiter=",", usecols=range(10), ndmin=2)
+    if len(times) != len(counts):
+        raise ValueError(f"{time_file} has {len(times)} rows but {output_file} has {len(counts)}")
+    if (times[:, 1:5] != counts[:, 0:4]).any():
+        raise ValueError(f"Parameters (n,m,k,q) of {time_file} and {output_file} are not aligned")
+
+    cols = {
+        "n": times[:, 1], "m": times[:, 2], "k": times[:, 3], "q": times[:, 4],
+        "sweep": sweep_ids(times, counts),
+        "sample": times[:, 0], "seconds": times[:, 5], "rss_kb": times[:, 6],
+    }
+    for idx, t in enumerate(TYPES):
+        cols[f"type{t}"] = counts[:, 4 + idx]
+    return {name: cols[name].astype(dtype) for name, dtype in COLUMNS.items()}
+
+
+#Finds the (time_stats, output_groebner) pairs of a directory
+def find_sweeps(directory):
+    pairs = []
+    for time_file in sorted(glob.glob(os.path.join(directory, "time_stats*.csv"))):
+        suffix = re.sub(r"^time_stats", "", os.path.basename(time_file))
+        output_file = os.path.join(directory, "output_groebner" + suffix)
+        if os.path.exists(output_file):
+            pairs.append((time_file, output_file))
+    return pairs
+
+
+def load_store(path):
+    """
+    returns: dictionary column -> read-only memory-mapped array
+    (empty arrays if the store does not exist yet)
+    """
+    if not os.path.isdir(path):
+        return {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+    cols = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in COLUMNS
+            if os.path.exists(os.path.join(path, f"{name}.npy"))}
+    if "sweep" not in cols:
+        #stores written before sweep ids: all rows belong to one unknown sweep
+        cols["sweep"] = np.zeros(len(cols["n"]), dtype=np.uint64)
+    return cols
+
+
+def write_store(path, cols):
+    #sort by key, later rows replace earlier rows with the same key
+    order = np.lexsort([cols[name] for name in reversed(KEY)])
+    cols = {name: np.asarray(c)[order] for name, c in cols.items()}
+    keys = np.stack([cols[name].astype(np.uint64) for name in KEY], axis=1)
+    last = np.ones(len(keys), dtype=bool)
+    if len(keys) > 1:
+        last[:-1] = (keys[1:] != keys[:-1]).any(axis=1)
+    os.makedirs(path, exist_ok=True)
+    for name, dtype in COLUMNS.items():
+        tmp = os.path.join(path, f"{name}.tmp.npy")
+        np.save(tmp, cols[name][last].astype(dtype))
+        os.replace(tmp, os.path.join(path, f"{name}.npy"))
+    return int(last.sum())
+
+
+def ingest(path, sweeps):
+    """
+    path: store directory (created if needed)
+    sweeps: list of (time_stats, output_groebner) file pairs
+
+    returns: number of rows in the store
+    """
+    parts = [{name: np.array(c) for name, c in load_store(path).items()}]
+    parts += [read_sweep(t, o) for t, o in sweeps]
+    cols = {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+    return write_store(path, cols)
+
+
+#---------------------------
+# Queries
+#---------------------------
+class GroupAggregate:
+    """
+    Single-pass accumulator of the statistics of one group of rows
+
+    Means and variances are merged chunk by chunk (Chan et al.), count
+    histograms with bincount, and time/RSS quantiles are read from fixed
+    log-spaced histograms so memory does not grow with the number of rows.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.any_cycle = 0
+        self.mean = np.zeros(len(TYPES))
+        self.m2 = np.zeros(len(TYPES))
+        self.hist = [np.zeros(1, dtype=np.int64) for _ in TYPES]
+        self.seconds = np.zeros(len(SECONDS_BINS) + 1, dtype=np.int64)
+        self.rss = np.zeros(len(RSS_BINS) + 1, dtype=np.int64)
+
+    def update(self, counts, seconds, rss):
+        #counts: (rows, 6) array of per-type counts of this chunk
+        b = len(counts)
+        if b == 0:
+            return
+        counts = counts.astype(np.float64)
+        mean_b = counts.mean(axis=0)
+        m2_b = ((counts - mean_b) ** 2).sum(axis=0)
+        total = self.rows + b
+        delta = mean_b - self.mean
+        self.mean += delta * b / total
+        self.m2 += m2_b + delta ** 2 * self.rows * b / total
+        self.rows = total
+
+        self.any_cycle += int((counts.sum(axis=1) > 0).sum())
+        for idx in range(len(TYPES)):
+            h = np.bincount(counts[:, idx].astype(np.int64))
+            if len(h) > len(self.hist[idx]):
+                h[:len(self.hist[idx])] += self.hist[idx]
+                self.hist[idx] = h
+            else:
+                self.hist[idx][:len(h)] += h
+        self.seconds += np.bincount(np.searchsorted(SECONDS_BINS, seconds), minlength=len(self.seconds))
+        self.rss += np.bincount(np.searchsorted(RSS_BINS, rss), minlength=len(self.rss))
+
+    @staticmethod
+    def _quantile(hist, bins, p):
+        idx = int(np.searchsorted(np.cumsum(hist), p * hist.sum()))
+        return float(bins[min(idx, len(bins) - 1)])
+
+    def result(self, quantiles=(0.5, 0.9, 0.99)):
+        var = self.m2 / (self.rows - 1) if self.rows > 1 else np.zeros(len(TYPES))
+        res = {"rows": self.rows, "p_any_cycle": self.any_cycle / self.rows if self.rows else 0.0}
+        for idx, t in enumerate(TYPES):
+            res[f"type{t}"] = {"mean": float(self.mean[idx]), "var": float(var[idx]),
+                               "histogram": self.hist[idx].tolist()}
+        res["seconds"] = {p: self._quantile(self.seconds, SECONDS_BINS, p) for p in quantiles}
+        res["rss_kb"] = {p: self._quantile(self.rss, RSS_BINS, p) for p in quantiles}
+        return res
+
+
+def query(store, group_by=("n", "m", "k", "q"), where=None):
+    """
+    store: dictionary column -> array, see load_store
+    group_by: key columns to group on
+    where: dictionary column -> value, or (low, high) inclusive range
+
+    returns: dictionary group tuple -> GroupAggregate.result()
+    """
+    where = where or {}
+    rows = len(store["n"])
+    groups = {}
+    for start in range(0, rows, CHUNK):
+        sl = slice(start, min(start + CHUNK, rows))
+        mask = np.ones(sl.stop - sl.start, dtype=bool)
+        for name, cond in where.items():
+            col = store[name][sl]
+            if isinstance(cond, tuple):
+                mask &= (col >= cond[0]) & (col <= cond[1])
+            else:
+                mask &= col == cond
+        if not mask.any():
+            continue
+        keys = np.stack([store[name][sl][mask].astype(np.uint64) for name in group_by], axis=1)
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.stack([store[f"type{t}"][sl][mask] for t in TYPES], axis=1)
+        seconds = store["seconds"][sl][mask]
+        rss = store["rss_kb"][sl][mask]
+        for g, key in enumerate(uniq):
+            sel = inverse == g
+            agg = groups.setdefault(tuple(int(x) for x in key), GroupAggregate())
+            agg.update(counts[sel], seconds[sel], rss[sel])
+    return {key: agg.result() for key, agg in sorted(groups.items())}
+
+
+#---------------------------
+# Command line
+#---------------------------
+#Integer literals stay exact (64-bit sweep ids do not fit in a float)
+def parse_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_where(conditions):
+    #"n=5" -> 5, "q=7:13" -> (7, 13), "seconds=0.5:2" -> (0.5, 2)
+    where = {}
+    for cond in conditions:
+        name, value = cond.split("=")
+        if ":" in value:
+            low, high = value.split(":")
+            where[name] = (parse_number(low), parse_number(high))
+        else:
+            where[name] = parse_number(value)
+    return where
+
+
+def argparser():
+    parser = argparse.ArgumentParser(
+        description="Columnar store and aggregation of groebner_tester.sh results",
+        epilog="Example usage: python3 stats_store.py ingest store ../statistics && python3 stats_store.py query store --group_by=n,q --where n=5"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    ing = sub.add_parser("ingest", help="Adds sweep CSVs to the store")
+    ing.add_argument("store", type=str, help="Store directory")
+    ing.add_argument("inputs", type=str, nargs="+", help="Directories with time_stats*/output_groebner* pairs, or a TIME_CSV,OUTPUT_CSV pair")
+    qry = sub.add_parser("query", help="Aggregates the store")
+    qry.add_argument("store", type=str, help="Store directory")
+    qry.add_argument("--group_by", type=str, default="n,m,k,q", help="Comma separated key columns")
+    qry.add_argument("--where", type=str, nargs="*", default=[], help="Filters such as n=5 or q=7:13")
+    qry.add_argument("--histograms", action="store_true", help="Also prints per-type count histograms")
+    return parser.parse_args()
+
+
+def main():
+    args = argparser()
+    if args.command == "ingest":
+        sweeps = []
+        for item in args.inputs:
+            if os.path.isdir(item):
+                sweeps += find_sweeps(item)
+            else:
+                sweeps.append(tuple(item.split(",")))
+        rows = ingest(args.store, sweeps)
+        print(f"Ingested {len(sweeps)} sweep(s), store holds {rows} rows")
+        return
+
+    start = time.time()
+    group_by = args.group_by.split(",")
+    results = query(load_store(args.store), group_by=group_by, where=parse_where(args.where))
+    elapsed = time.time() - start
+    for key, res in results.items():
+        print(", ".join(f"{name}={value}" for name, value in zip(group_by, key)) + f"  ({res['rows']} rows)")
+        print(f"\tP(any 4-cycle): {res['p_any_cycle']:.4f}")
+        for t in TYPES:
+            r = res[f"type{t}"]
+            line = f"\tType {t}: mean {r['mean']:.4f}, var {r['var']:.4f}"
+            if args.histograms:
+                line += f", histogram {r['histogram']}"
+            print(line)
+        print("\tseconds: " + ", ".join(f"p{int(100 * p)} {v:.3g}" for p, v in res["seconds"].items()))
+        print("\trss_kb: " + ", ".join(f"p{int(100 * p)} {v:.0f}" for p, v in res["rss_kb"].items()))
+    sys.stderr.write(f"Query time: {1000 * elapsed:.1f} ms\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,29 @@
 from sage.all import *
 from sage.graphs.graph import Graph
+import numpy as np
+from sparse_tensor import *
+from finite_field import Fq
+from vectorized import tensor_to_array, projective_points, normalize_points, projective_index
+from out_of_core import edge_blocks, vertex_offsets
 
 """
 Defines tensor operations and constructs graph
 """
 
+#Graph construction engines: table-driven NumPy kernel, or the per-pair Sage
+#loop over the nonzero entries only (sparse) or over every entry (sage)
+ENGINES = ["vectorized", "sparse", "sage"]
+
+#X points per block and kernel enumeration chunk of the vectorized engine
+VECTORIZED_BLOCK = 4096
+VECTORIZED_CHUNK = 1 << 20
+
 #Evaluate the tensor on three vectors.
 def tensor_value(T, u, v, w):
     #T is assumed to be a 3-tensor given as a 3D list: T[i][j][k]
     #u, v, w are vectors 
+    if isinstance(T, SparseTensor):
+        return tensor_value_sparse(T, u, v, w)
     s = T[0][0][0].parent()(0) #zero of the field where T is defined
     for i in range(len(u)):
         for j in range(len(v)):
@@ -20,6 +35,8 @@ def tensor_value(T, u, v, w):
 def is_edge_UV(T, u, v):
     #For fixed u in U and v in V, check that
     #for every coordinate k, sum_{i,j} u_i * v_j * T[i][j][k] == 0.
+    if isinstance(T, SparseTensor):
+        return is_edge_UV_sparse(T, u, v)
     kdim = len(T[0][0])
     F = T[0][0][0].parent()
     for k in range(kdim):
@@ -34,6 +51,8 @@ def is_edge_UV(T, u, v):
 def is_edge_UW(T, u, w):
     #For fixed u in U and w in W, check that for each j,
     #sum_{i,k} u_i * w_k * T[i][j][k] == 0.
+    if isinstance(T, SparseTensor):
+        return is_edge_UW_sparse(T, u, w)
     mdim = len(T[0])
     F = T[0][0][0].parent()
     for j in range(mdim):
@@ -48,6 +67,8 @@ def is_edge_UW(T, u, w):
 def is_edge_VW(T, v, w):
     #For fixed v in V and w in W, check that for each i,
     #sum_{j,k} v[j] * w[k] * T[i][j][k] == 0.
+    if isinstance(T, SparseTensor):
+        return is_edge_VW_sparse(T, v, w)
     ndim = len(T)
     F = T[0][0][0].parent()
     for i in range(ndim):
@@ -59,9 +80,30 @@ def is_edge_VW(T, v, w):
             return False
     return True
 
+#Integer array of a 3d-list tensor or SparseTensor over F (see finite_field.py)
+def field_array(T, field):
+    if isinstance(T, SparseTensor):
+        T = T.to_dense()
+    return tensor_to_array(T, field)
+
+#Labels offset+1.. of Sage projective points in the order of vectorized.projective_points
+def vectorized_labels(P, field, offset):
+    A = np.array([[field.to_int(c) for c in p] for p in P], dtype=np.int64)
+    return (offset + 1 + projective_index(normalize_points(A, field), field.q)).tolist()
+
 # Main function that builds the graph associated with a 3-tensor.
-def tensor_to_graph(T, n, m, k, F, verbose=False, minimal=False):
+def tensor_to_graph(T, n, m, k, F, verbose=False, minimal=False, engine="vectorized",
+                    block=VECTORIZED_BLOCK, chunk=VECTORIZED_CHUNK):
+    if engine == "vectorized":
+        return tensor_to_graph_vectorized(T, n, m, k, F, verbose, minimal, block, chunk)
+    #Edge tests skip zero entries on the sparse engine
+    if engine == "sparse":
+        T = T if isinstance(T, SparseTensor) else to_sparse(T)
+        if not(minimal):
+            print(f"Using sparse tensor ({len(T.entries)} nonzero entries, density {T.density():.3f})")
+
     #List elements of the projective spaces for U, V, and W.
+    field = Fq.from_sage(F)
     P_U = list(ProjectiveSpace(n-1, F))
     P_V = list(ProjectiveSpace(m-1, F))
     P_W = list(ProjectiveSpace(k-1, F))
@@ -82,22 +124,16 @@ def tensor_to_graph(T, n, m, k, F, verbose=False, minimal=False):
     
     if not(minimal):
         print("Labeling all vertices")
-    #progressive labeling with unique integer ID
+    #unique integer IDs, in the order of the vectorized engine so that labels
+    #do not depend on the engine (see vectorized_labels)
     #previous versions set label as ("U",idx)/("V",idx)/("W",idx)
-    id_c = 0
-    for idx, p in enumerate(P_U):
-        id_c += 1
-        label = id_c 
-        vertices_u.append(id_c)
-        vv_map[label] = vector(F, p)  
-    for idx, p in enumerate(P_V):
-        id_c += 1
-        label = id_c 
+    for label, p in zip(vectorized_labels(P_U, field, 0), P_U):
+        vertices_u.append(label)
+        vv_map[label] = vector(F, p)
+    for label, p in zip(vectorized_labels(P_V, field, len(P_U)), P_V):
         vertices_v.append(label)
         vv_map[label] = vector(F, p)
-    for idx, p in enumerate(P_W):
-        id_c += 1
-        label = id_c
+    for label, p in zip(vectorized_labels(P_W, field, len(P_U) + len(P_V)), P_W):
         vertices_w.append(label)
         vv_map[label] = vector(F, p)
     
@@ -137,11 +173,46 @@ def tensor_to_graph(T, n, m, k, F, verbose=False, minimal=False):
     
     return G
 
-def apply_isometry(T, A, B, C):
+#Same graph as tensor_to_graph, with the neighbours of whole blocks of points
+#computed as kernels of contractions of T over the integer tables of F
+def tensor_to_graph_vectorized(T, n, m, k, F, verbose=False, minimal=False,
+                               block=VECTORIZED_BLOCK, chunk=VECTORIZED_CHUNK):
+    field = Fq.from_sage(F)
+    C = field_array(T, field)
+    offsets, sizes, N = vertex_offsets(C, field.q)
+
+    if not(minimal):
+        print("Sizes of projective Spaces:")
+        for X, size in sizes.items():
+            print(f"{X} : {size}")
+
+    #labels 1..N: P(U), then P(V), then P(W), each in the order of projective_points
+    if verbose:
+        print("Label-node mapping")
+        for X, d in zip("UVW", (n, m, k)):
+            for idx, p in enumerate(projective_points(d, field.q)):
+                print(offsets[X] + idx + 1, vector(F, [field.to_sage(F, a) for a in p]))
+
+    G = Graph(multiedges=False)
+    G.add_vertices(range(1, N + 1))
+    for X, Z in [("U", "V"), ("U", "W"), ("V", "W")]:
+        if not(minimal):
+            print(f"Adding {X} {Z} edges")
+        for x, z in edge_blocks(C, field, X, Z, block, chunk):
+            G.add_edges(zip((x + offsets[X] + 1).tolist(), (z + offsets[Z] + 1).tolist()))
+    return G
+
+def apply_isometry(T, A, B, C, engine="vectorized"):
     #T : 3-tensor represented as a 3d list
     #A,B,C Invertible matrices
     #returns: T' s.t. T'(u,v,w) = T(Au,Bv,Cw) 
     #w coefficients T'_{p,q,r} = sum_{i,j,k} T_{i,j,k} * A[i,p] * B[j,q] * C[k,r]
+    if engine == "vectorized":
+        return apply_isometry_vectorized(T, A, B, C)
+    if engine == "sparse":
+        return apply_isometry_sparse(T if isinstance(T, SparseTensor) else to_sparse(T), A, B, C)
+    if isinstance(T, SparseTensor):
+        T = T.to_dense()
     n = len(T)
     m = len(T[0])
     k = len(T[0][0])
@@ -162,6 +233,16 @@ def apply_isometry(T, A, B, C):
                 T_prime[p][q][r] = s
     return T_prime
 
+#apply_isometry as three mode products over the integer tables of the field
+def apply_isometry_vectorized(T, A, B, C):
+    F = A.base_ring()
+    field = Fq.from_sage(F)
+    X = field_array(T, field)
+    for axis, M in enumerate((A, B, C)):
+        M = np.array([[field.to_int(x) for x in row] for row in M.rows()], dtype=np.int64)
+        X = field.mode_product(X, M, axis)
+    return [[[field.to_sage(F, x) for x in row] for row in S] for S in X.tolist()]
+
 
 #========= ADDITIONAL FUNCTIONS FOR TESTING ================
 #Prints evaluation of tensor C for a candidate triangle T
@@ -189,8 +270,15 @@ def coerce_tensor(C, q):
 
 #Transforms 3d-array of int's to 3d-array of elements in GF(q) 
 def coerce_list(v, q):
-    F = GF(q)
-    return [F(x) for x in v]
+    F = GF(q, 'a')
+    return [field_element(F, x) for x in v]
+
+#Element of F given by an entry of a tensor file; over GF(p^e) with e > 1,
+#integers are read in base p as the coefficients of F.gen() (F.from_integer)
+def field_element(F, x):
+    if F.degree() > 1 and x in ZZ:
+        return F.from_integer(int(x) % F.order())
+    return F(x)
 
 
 #Read and parse a 3-tensor over F_q
@@ -204,7 +292,7 @@ def parse_tensor_from_file(filename, q):
     Returns a 3-dimensional list with elements in F_q
     """
     #Define the finite field
-    F = GF(q)
+    F = GF(q, 'a')
 
     #Read file content
     with open(filename, 'r') as f:
@@ -214,7 +302,7 @@ def parse_tensor_from_file(filename, q):
     raw_tensor = sage_eval(data_str, locals={'F': F})
 
     #Convert all entries to elements of F_q
-    T = [[[F(entry) for entry in row] for row in matrix] for matrix in raw_tensor]
+    T = [[[field_element(F, entry) for entry in row] for row in matrix] for matrix in raw_tensor]
 
     return T
 
@@ -1,6 +1,7 @@
 import networkx as nx
 import matplotlib.pyplot as plt
 import os 
+from triangles import triangle_vertices
 
 """
 Graph display and image/graph serialization functions
@@ -56,6 +57,21 @@ def find_cycles_of_length_c(G, c):
     return list(cycles_set)
 
 
+#Vertices on cycles of length c (or 2 < c' <= c if loose), highlighted by graph_display
+def cycle_nodes(G,n,m,k,q,cycle,loose=False):
+    u_bound = 3 if loose else cycle
+    special_nodes = []
+    for i in range(u_bound, cycle+1):
+        print(f"Finding cycles of length {i}...")
+        #triangles are found with the bit-packed engine of triangles.py
+        if i == 3:
+            special_nodes += triangle_vertices(G,n,m,k,q)
+        else:
+            special_nodes += find_cycles_of_length_c(G,i)
+        print(special_nodes)
+    return special_nodes
+
+
 #Saves displayed graph into png image
 def save_graph(n,m,k,q):
     #n,m,k dimensions of graph
@@ -82,10 +98,11 @@ def save_graph(n,m,k,q):
 
 
 #Displays sage graph by translating it into NX
-def graph_display(G,n,m,k,q,cycle=None,labeled=False, save=False, loose=False, minimal=False):
+def graph_display(G,n,m,k,q,cycle=None,labeled=False, save=False, loose=False, minimal=False, center=None):
     #G sage graph
     #n,m,k dimensions
     #q field
+    #center: highlighted vertex, e.g. the center of an ego-graph (see query.py)
 
     #set fullscreen
     manager = plt.get_current_fig_manager()
@@ -101,13 +118,7 @@ def graph_display(G,n,m,k,q,cycle=None,labeled=False, save=False, loose=False, m
 
     #if there is a specific type of cycle to compute
     if cycle != None and cycle > 2:
-        u_bound = 3 if loose else cycle
-        special_nodes = []
-        # Define special nodes (e.g., nodes divisible by 20)
-        for i in range(u_bound, cycle+1):
-            print(f"Finding cycles of length {i}...")
-            special_nodes += find_cycles_of_length_c(G,i)
-            print(special_nodes)
+        special_nodes = cycle_nodes(G,n,m,k,q,cycle,loose)
         #Use a layout for consistent positioning
         pos = nx.spring_layout(G_vis)
 
@@ -122,7 +133,11 @@ def graph_display(G,n,m,k,q,cycle=None,labeled=False, save=False, loose=False, m
         #nx.draw_networkx_labels(G_vis, pos)
     else:
         #Otherwise just draw the graph
-        nx.draw(G_vis, with_labels=labeled, node_color='white', edgecolors='black', node_size=8)
+        pos = nx.spring_layout(G_vis)
+        nx.draw(G_vis, pos, with_labels=labeled, node_color='white', edgecolors='black', node_size=8)
+
+    if center is not None:
+        nx.draw_networkx_nodes(G_vis, pos, nodelist=[center], node_color='blue', edgecolors='black')
 
     if not(minimal):
         #save graph to file
@@ -0,0 +1,121 @@
+import numpy as np
+
+"""
+Triangle enumeration on tripartite tensor graphs with bit-packed adjacency
+
+Every triangle of a tensor graph has one vertex in each of P(U), P(V), P(W).
+The W-neighbours of every U and V vertex are stored as rows of uint64 words,
+so the triangles through a UV edge (u,v) are the set bits of row(u) & row(v).
+
+Vertex labels follow tensor_to_graph: 1..|P(U)|, then P(V), then P(W).
+"""
+
+#Edges processed per vectorized batch
+CHUNK = 1 << 16
+
+#Number of set bits of every byte, used when np.bitwise_count is missing
+POPCOUNT_8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+#Label offsets and sizes of the three projective spaces
+def partition_layout(n, m, k, q):
+    sizes = [(q**d - 1) // (q - 1) for d in (n, m, k)]
+    offsets = [1, 1 + sizes[0], 1 + sizes[0] + sizes[1]]
+    return offsets, sizes
+
+
+#Number of set bits of each row of a (rows, words) uint64 array
+def popcount(rows):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(rows).sum(axis=1, dtype=np.int64)
+    return POPCOUNT_8[rows.view(np.uint8)].sum(axis=1)
+
+
+#Indices of the set bits of each row: (row indices, bit indices)
+def set_bits(rows):
+    bits = np.unpackbits(rows.astype("<u8").view(np.uint8), axis=1, bitorder="little")
+    return np.nonzero(bits)
+
+
+#Packs edges (r, c) of a bipartite graph into rows of bits
+def bit_rows(r, c, n_rows, n_cols):
+    """
+    r, c: arrays of row and column indices (0-based)
+
+    returns: (n_rows, ceil(n_cols / 64)) uint64 array with bit c of row r set
+    """
+    rows = np.zeros((n_rows, (n_cols + 63) // 64), dtype=np.uint64)
+    np.bitwise_or.at(rows, (r, c >> 6), np.left_shift(np.uint64(1), (c & 63).astype(np.uint64)))
+    return rows
+
+
+#Splits the edges of G into UV, UW and VW pairs of 0-based indices
+def split_edges(G, offsets):
+    E = np.array([(min(a, b), max(a, b)) for a, b in G.edges(labels=False)], dtype=np.int64).reshape(-1, 2)
+    part = np.searchsorted(offsets, E, side="right") - 1
+    split = {}
+    for name, (X, Z) in {"UV": (0, 1), "UW": (0, 2), "VW": (1, 2)}.items():
+        sel = (part[:, 0] == X) & (part[:, 1] == Z)
+        split[name] = (E[sel, 0] - offsets[X], E[sel, 1] - offsets[Z])
+    return split
+
+
+def find_triangles(G, n, m, k, q, listing=True, participation=True):
+    """
+    G: SageMath graph labeled as in tensor_to_graph
+    n,m,k,q: parameters of the tensor, used to locate the three partitions
+    listing: also return every triangle
+    participation: also return the number of triangles through every vertex
+
+    returns: dictionary with "count", and if requested "triangles", a (T, 3)
+    array of (u, v, w) labels, and "participation", a pair (labels, counts)
+    of arrays where counts[i] is the number of triangles through labels[i],
+    for every vertex with at least one edge (labels are sorted)
+    """
+    offsets, sizes = partition_layout(n, m, k, q)
+    split = split_edges(G, offsets)
+    #rows and bits only for the vertices of G, which may be a small part of
+    #each projective space (e.g. ego-graphs of query.py)
+    present = [np.unique(np.concatenate([split["UV"][0], split["UW"][0]])),
+               np.unique(np.concatenate([split["UV"][1], split["VW"][0]])),
+               np.unique(np.concatenate([split["UW"][1], split["VW"][1]]))]
+    def rank(X, idx):
+        return np.searchsorted(present[X], idx)
+    UW = bit_rows(rank(0, split["UW"][0]), rank(2, split["UW"][1]), len(present[0]), len(present[2]))
+    VW = bit_rows(rank(1, split["VW"][0]), rank(2, split["VW"][1]), len(present[1]), len(present[2]))
+    u_all, v_all = rank(0, split["UV"][0]), rank(1, split["UV"][1])
+
+    count = 0
+    found = []
+    #indexed by rank in present: labels can be far larger than G (ego-graphs)
+    through = [np.zeros(len(p), dtype=np.int64) for p in present]
+    for start in range(0, len(u_all), CHUNK):
+        u = u_all[start:start + CHUNK]
+        v = v_all[start:start + CHUNK]
+        common = UW[u] & VW[v]
+        per_edge = popcount(common)
+        count += int(per_edge.sum())
+        hit = np.nonzero(per_edge)[0]
+        if len(hit) == 0 or not (listing or participation):
+            continue
+        e, w = set_bits(common[hit])
+        ranks = [u[hit][e], v[hit][e], w]
+        if listing:
+            found.append(np.stack([present[X][ranks[X]] + offsets[X] for X in range(3)], axis=1))
+        if participation:
+            for X in range(3):
+                np.add.at(through[X], ranks[X], 1)
+
+    res = {"count": count}
+    if listing:
+        res["triangles"] = np.concatenate(found) if found else np.zeros((0, 3), dtype=np.int64)
+    if participation:
+        res["participation"] = (np.concatenate([present[X] + offsets[X] for X in range(3)]),
+                                np.concatenate(through))
+    return res
+
+
+#Vertices lying on at least one triangle (drop-in for find_cycles_of_length_c(G, 3))
+def triangle_vertices(G, n, m, k, q):
+    labels, counts = find_triangles(G, n, m, k, q, listing=False)["participation"]
+    return [int(v) for v in labels[counts > 0]]
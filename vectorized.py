@@ -0,0 +1,209 @@
+import numpy as np
+from finite_field import Fq
+
+"""
+Vectorized tensor operations over finite fields F_q.
+
+Field elements are stored as integers in [0, q) inside NumPy arrays (see
+finite_field.py for the encoding of prime power fields) and all arithmetic
+goes through an Fq table object, so these helpers run without SageMath and
+work on whole batches of projective points at once.
+"""
+
+#Axis of the tensor C[i][j][l] associated with each vector space
+AXES = {"U": 0, "V": 1, "W": 2}
+
+
+#Transforms a 3d-list tensor (ints or elements of GF(q)) into an int array
+def tensor_to_array(T, field):
+    return np.array([[[field.to_int(x) for x in row] for row in M] for M in T], dtype=np.int64)
+
+
+#Number of points of the projective space P(F_q^d)
+def projective_size(d, q):
+    return (q**d - 1) // (q - 1)
+
+
+#Draws uniformly distributed points of P(F_q^d)
+def random_projective_points(rng, count, d, q):
+    """
+    rng: numpy Generator
+    count: number of points
+    d: dimension of the underlying vector space
+
+    returns: (count, d) array of representatives
+
+    Every projective point has exactly q-1 nonzero representatives, hence a
+    uniform nonzero vector is a uniform projective point.
+    """
+    P = rng.integers(0, q, size=(count, d), dtype=np.int64)
+    zero = ~P.any(axis=1)
+    while zero.any():
+        P[zero] = rng.integers(0, q, size=(int(zero.sum()), d), dtype=np.int64)
+        zero = ~P.any(axis=1)
+    return P
+
+
+#Scales every representative so that its first nonzero coordinate is 1
+def normalize_points(P, field):
+    lead = P[np.arange(len(P)), (P != 0).argmax(axis=1)]
+    return field.mul(P, field.inv(lead)[:, None])
+
+
+#Tests coordinate-wise which pairs of representatives define the same point
+def same_points(P1, P2, field):
+    return (normalize_points(P1, field) == normalize_points(P2, field)).all(axis=1)
+
+
+#Linear conditions on the neighbours in Z of a batch of points x in X
+def neighbour_constraints(C, x, X, Z, field):
+    """
+    C: tensor as an int array of shape (n, m, k)
+    x: (B, dim X) batch of points of P(X)
+    X, Z: distinct space names among "U", "V", "W"
+
+    returns: (B, dim Y, dim Z) array M with Y the remaining space, such that
+    z in P(Z) is adjacent to x iff M[b] z = 0
+    e.g. for X = U, Z = V: M[b][l][j] = sum_i x_i C[i][j][l]
+    """
+    a, z = AXES[X], AXES[Z]
+    M = field.contract(x, C, a)
+    rest = [ax for ax in range(3) if ax != a]
+    if rest.index(z) == 0:
+        M = M.transpose(0, 2, 1)
+    return M
+
+
+#Points of P(F_q^d) with indices in [start, stop)
+def projective_points(d, q, start=0, stop=None):
+    """
+    Points are normalized so that their first nonzero coordinate is 1 and
+    ordered by the position of that coordinate, then lexicographically:
+    (1,0,..,0), (1,0,..,1), ..., (0,1,0,..), ..., (0,..,0,1)
+
+    returns: (stop - start, d) array
+    """
+    if stop is None:
+        stop = projective_size(d, q)
+    idx = np.arange(start, stop, dtype=np.int64)
+    #offsets[p] = index of the first point with leading coordinate at p
+    offsets = np.concatenate([[0], np.cumsum([q**(d-1-p) for p in range(d)])])
+    lead = np.searchsorted(offsets, idx, side="right") - 1
+    rest = idx - offsets[lead]
+    P = np.zeros((len(idx), d), dtype=np.int64)
+    for j in range(d):
+        P[:, j] = np.where(j == lead, 1, np.where(j > lead, (rest // q**(d-1-j)) % q, 0))
+    return P
+
+
+#Index of normalized points in the ordering of projective_points
+def projective_index(P, q):
+    d = P.shape[1]
+    offsets = np.concatenate([[0], np.cumsum([q**(d-1-p) for p in range(d)])])
+    lead = (P != 0).argmax(axis=1)
+    weights = q ** np.arange(d - 1, -1, -1, dtype=np.int64)
+    return offsets[lead] + P @ weights - weights[lead]
+
+
+#Reduced row echelon form of a batch of matrices over F_q
+def batch_rref(M, field):
+    """
+    M: (B, r, c) array with entries in [0, q)
+
+    returns: (R, rank, pivots) where R[b] is the reduced row echelon form of
+    M[b], rank[b] its rank and pivots[b][t] the pivot column of row t
+    (-1 for t >= rank[b])
+    """
+    M = np.array(M, dtype=np.int64)
+    B, r, c = M.shape
+    rows = np.arange(r)
+    rank = np.zeros(B, dtype=np.int64)
+    pivots = np.full((B, r), -1, dtype=np.int64)
+    for col in range(c):
+        #first row at or below the current pivot row with a nonzero entry
+        cand = (M[:, :, col] != 0) & (rows[None, :] >= rank[:, None])
+        has = cand.any(axis=1)
+        if not has.any():
+            continue
+        b = np.nonzero(has)[0]
+        piv = cand[b].argmax(axis=1)
+        top = rank[b]
+        #swap pivot row into place and scale it to a leading 1
+        pivot_row = M[b, piv]
+        M[b, piv] = M[b, top]
+        pivot_row = field.mul(pivot_row, field.inv(pivot_row[:, col])[:, None])
+        M[b, top] = pivot_row
+        #clear the column everywhere else
+        factors = M[b, :, col]
+        factors[np.arange(len(b)), top] = 0
+        M[b] = field.sub(M[b], field.mul(factors[:, :, None], pivot_row[:, None, :]))
+        pivots[b, top] = col
+        rank[b] += 1
+    return M, rank, pivots
+
+
+#Rank of a batch of matrices over F_q
+def batch_rank(M, field):
+    return batch_rref(M, field)[1]
+
+
+#Basis of the kernel of each matrix of a batch
+def batch_kernel(M, field):
+    """
+    M: (B, r, c) array with entries in [0, q)
+
+    returns: (K, free) where free[b] marks the non-pivot columns of M[b] and,
+    for each free column f, K[b][f] is the kernel vector with a 1 at f and
+    zeros at the other free columns (rows of pivot columns are zero)
+    """
+    R, rank, pivots = batch_rref(M, field)
+    B, r, c = R.shape
+    K = np.zeros((B, c, c), dtype=np.int64)
+    for t in range(r):
+        b = np.nonzero(t < rank)[0]
+        K[b, :, pivots[b, t]] = field.neg(R[b, t, :])
+    free = np.ones((B, c), dtype=bool)
+    for t in range(r):
+        b = np.nonzero(t < rank)[0]
+        free[b, pivots[b, t]] = False
+    K *= free[:, :, None]
+    diag = np.arange(c)
+    K[:, diag, diag] = free
+    return K, free
+
+
+#Number of projective points in the kernel of each matrix of a batch
+def projective_kernel_size(M, field):
+    dim = M.shape[2] - batch_rank(M, field)
+    return (field.q**dim - 1) // (field.q - 1)
+
+
+#Enumerates the projective kernel points of each matrix of a batch
+def iter_kernel_points(M, field, chunk=1 << 20):
+    """
+    M: (B, r, c) array with entries in [0, q)
+    chunk: bound on the number of coordinates materialized at once
+
+    yields: (items, P) where P[t] is a normalized point of P(F_q^c) in the
+    kernel of M[items[t]]; every kernel point is yielded exactly once
+    """
+    K, free = batch_kernel(M, field)
+    q = field.q
+    nullity = free.sum(axis=1)
+    c = M.shape[2]
+    for d in np.unique(nullity):
+        if d == 0:
+            continue
+        group = np.nonzero(nullity == d)[0]
+        basis = K[group][free[group]].reshape(len(group), d, c)
+        s = projective_size(d, q)
+        #slices of matrices and of coefficient vectors fitting in chunk
+        per_coeffs = max(1, min(s, chunk // c))
+        per_items = max(1, chunk // (per_coeffs * c))
+        for c0 in range(0, s, per_coeffs):
+            coeffs = projective_points(d, q, c0, min(c0 + per_coeffs, s))
+            for g0 in range(0, len(group), per_items):
+                g1 = min(g0 + per_items, len(group))
+                P = field.matmul(coeffs[None], basis[g0:g1])
+                items = np.repeat(group[g0:g1], len(coeffs))
+                yield items, normalize_points(P.reshape(-1, c), field)